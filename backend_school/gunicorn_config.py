@@ -0,0 +1,54 @@
+"""
+Gunicorn configuration of the REST API.
+
+    gunicorn -c backend_school/gunicorn_config.py backend_school.wsgi
+
+Command line options override the values below.
+"""
+import multiprocessing
+
+bind = '0.0.0.0:8080'
+
+# the application is loaded once in the master process and forked, so the workers share its memory pages
+preload_app = True
+
+# sync workers keep one persistent database connection each and do not contend for the GIL while encoding
+# big responses, (2 x cores + 1) workers keep the cores busy while the others wait for PostgreSQL
+worker_class = 'sync'
+workers = multiprocessing.cpu_count() * 2 + 1
+
+# big imports are parsed and written within the request
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# workers are restarted gracefully after this number of requests, jitter keeps them from restarting at once
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def when_ready(server):
+    """
+    Import the views with their heavy dependencies in the master process before the workers are forked.
+    """
+    from django.db import connections
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+    # connections must not be shared with the forked workers
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    """
+    Open the persistent database connection of the worker before the first request.
+    """
+    from django.db import DatabaseError
+
+    from citizens.db import warm_up_connections
+
+    try:
+        warm_up_connections()
+    except DatabaseError as e:
+        server.log.warning('Database connection of worker %s is not opened: %s', worker.pid, e)
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'citizens.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +86,8 @@ DATABASES = {
         'PASSWORD': database_config['password'],
         'HOST': database_config['host'],
         'PORT': database_config['port'],
+        # persistent connections are reused by the requests of a worker for this number of seconds
+        'CONN_MAX_AGE': database_config.getint('conn_max_age', 60),
     }
 }
 
@@ -123,3 +126,58 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Citizens import
+# Number of citizens written to the database with one statement
+CITIZENS_IMPORT_BATCH_SIZE = 1000
+# Use PostgreSQL COPY instead of INSERT for import writes
+CITIZENS_IMPORT_USE_COPY = True
+# Import payloads are hashed to a temporary file which is kept in memory till this number of bytes
+CITIZENS_IMPORT_SPOOL_SIZE = 16 * 1024 * 1024
+
+# Citizens responses
+# JSON encoder of the responses: 'orjson' (the standard library is used if it is not installed) or 'json'
+CITIZENS_JSON_BACKEND = 'orjson'
+
+# Citizens list
+# Citizens lists of at least this size are streamed to the client
+CITIZENS_LIST_STREAMING_THRESHOLD = 10000
+# Maximum and default limit of the citizens list page
+CITIZENS_LIST_MAX_LIMIT = 10000
+
+# Citizens responses cache
+# Maximum total size in bytes of the cached GET responses per worker process
+CITIZENS_RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
+
+# Age percentiles
+# 'database' counts age percentiles with percentile_cont in PostgreSQL, 'numpy' counts them in the worker process
+CITIZENS_AGE_PERCENTILES_BACKEND = 'numpy'
+
+# Responses compression
+# Content encodings of the import GET responses in the order of preference, 'br' requires brotli package
+CITIZENS_COMPRESSION_ENCODINGS = ('br', 'gzip')
+# Responses smaller than this number of bytes are not compressed
+CITIZENS_COMPRESSION_MIN_SIZE = 1024
+
+# Asynchronous imports
+# Number of validated citizens between progress updates of the import job
+CITIZENS_IMPORT_JOB_PROGRESS_STEP = 10000
+# Seconds after which a job still being validated or written is considered abandoned by a killed worker and is
+# claimed again
+CITIZENS_IMPORT_JOB_TIMEOUT = 3600
+# Number of times a job is claimed before it is failed
+CITIZENS_IMPORT_JOB_MAX_ATTEMPTS = 3
+
+# Import validation
+# Number of processes checking citizen fields of big imports, 0 checks them in the request process
+CITIZENS_VALIDATION_PROCESSES = 0
+# Number of citizens checked by one task, imports of one chunk are always checked in the request process
+CITIZENS_VALIDATION_CHUNK_SIZE = 5000
+
+# Request metrics
+# Client addresses allowed to read the metrics endpoint
+CITIZENS_METRICS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
+
+# Database connections
+# Check persistent database connections before every request and reconnect if they are broken
+CITIZENS_DB_HEALTH_CHECKS = True
@@ -0,0 +1,18 @@
+"""
+Performance benchmarks of the citizens application.
+
+Run a benchmark from the project root, e.g.:
+
+    python -m benchmarks.validation
+"""
+import os
+
+
+def setup_django():
+    """
+    Configure django settings before the project modules are imported.
+    """
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_school.settings')
+    django.setup()
@@ -0,0 +1,132 @@
+"""
+Benchmark of all API endpoints on generated imports.
+
+Every endpoint is called once per import size, the time, the number of SQL queries and optionally the peak
+Python memory are written to the JSON report which can be compared between releases. The database is left
+untouched: everything runs in one transaction which is rolled back at the end.
+
+    python -m benchmarks.endpoints --sizes 1000 10000 100000 --output report.json
+"""
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+from benchmarks import setup_django
+from benchmarks.generator import generate_citizens
+
+
+class Rollback(Exception):
+    pass
+
+
+def measure(name, size, request, memory):
+    """
+    Call the request function, return dict of its measurements.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from citizens.cache import response_cache
+
+    response_cache.clear()
+
+    if memory:
+        tracemalloc.start()
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = request()
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+
+    result = {'endpoint': name, 'citizens': size, 'status': response.status_code, 'seconds': round(elapsed, 4),
+              'queries': len(queries)}
+
+    if memory:
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print('%-12s %8d %6d %10.3f %8d %12s' % (name, size, response.status_code, elapsed, len(queries),
+                                             result.get('peak_memory', '-')))
+
+    return result, response
+
+
+def run_size(client, size, args):
+    from django.urls import reverse
+
+    payload = json.dumps(generate_citizens(size, args.towns, args.relatives, (args.first_year, args.last_year)),
+                         ensure_ascii=False)
+    results = []
+
+    result, response = measure('import', size, lambda: client.post(
+        reverse('citizens:imports'), payload, content_type='application/json'
+    ), args.memory)
+    results.append(result)
+
+    import_id = json.loads(response.content)['data']['import_id']
+
+    result, response = measure('patch', size, lambda: client.patch(
+        reverse('citizens:change_imports', kwargs={'import_id': import_id, 'citizen_id': size // 2}),
+        {'town': 'Новый город', 'birth_date': '01.01.1980', 'relatives': [1, 2, 3]}, content_type='application/json'
+    ), args.memory)
+    results.append(result)
+
+    for name, url_name in (('list', 'citizens:list'), ('birthdays', 'citizens:birthdays'),
+                           ('percentiles', 'citizens:towns_stat_percentile_age')):
+        result, response = measure(name, size, lambda: client.get(reverse(url_name, kwargs={'import_id': import_id})),
+                                   args.memory)
+        results.append(result)
+
+    return results
+
+
+def run(args):
+    setup_django()
+
+    from django.db import transaction, connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    client = Client()
+    results = []
+
+    print('%-12s %8s %6s %10s %8s %12s' % ('endpoint', 'citizens', 'status', 'seconds', 'queries', 'memory'))
+
+    try:
+        with transaction.atomic():
+            for size in args.sizes:
+                results.extend(run_size(client, size, args))
+
+            raise Rollback
+    except Rollback:
+        pass
+
+    report = {
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'parameters': {'towns': args.towns, 'relatives': args.relatives, 'birth_years': [args.first_year, args.last_year],
+                       'memory': args.memory},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=(1000, 10000, 100000), help='numbers of citizens')
+    parser.add_argument('--towns', type=int, default=10, help='number of different towns')
+    parser.add_argument('--relatives', type=int, default=3, help='maximum number of relatives added by citizen')
+    parser.add_argument('--first-year', type=int, default=1940, help='first year of birth dates')
+    parser.add_argument('--last-year', type=int, default=2010, help='last year of birth dates')
+    parser.add_argument('--memory', action='store_true', help='trace peak memory, it slows down the requests')
+    parser.add_argument('--output', help='path of the JSON report')
+
+    run(parser.parse_args())
@@ -0,0 +1,43 @@
+import random
+from datetime import date, timedelta
+
+
+def generate_citizens(citizens_count, towns_count=10, relatives_count=3, birth_years=(1940, 2010), seed=0):
+    """
+    Generate deterministic import payload of valid citizens with mutual relatives.
+    :param citizens_count: number of citizens
+    :param towns_count: number of different towns
+    :param relatives_count: maximum number of relatives added by every citizen
+    :param birth_years: (first, last) years of birth dates
+    :param seed: random seed, the same arguments always give the same payload
+    """
+    rnd = random.Random(seed)
+    first_birth_date = date(birth_years[0], 1, 1)
+    birth_dates_spread = (date(birth_years[1] + 1, 1, 1) - first_birth_date).days
+
+    citizens = []
+    for citizen_id in range(1, citizens_count + 1):
+        birth_date = first_birth_date + timedelta(days=rnd.randrange(birth_dates_spread))
+        citizens.append({
+            'citizen_id': citizen_id,
+            'town': 'Город %d' % rnd.randrange(towns_count),
+            'street': 'Улица %d' % rnd.randrange(100),
+            'building': '%dк%d' % (rnd.randrange(1, 100), rnd.randrange(1, 5)),
+            'apartment': rnd.randrange(1, 500),
+            'name': 'Житель %d' % citizen_id,
+            'birth_date': birth_date.strftime('%d.%m.%Y'),
+            'gender': rnd.choice(('male', 'female')),
+            'relatives': [],
+        })
+
+    for citizen in citizens:
+        for _ in range(rnd.randrange(relatives_count + 1)):
+            relative = citizens[rnd.randrange(citizens_count)]
+
+            if relative is citizen or relative['citizen_id'] in citizen['relatives']:
+                continue
+
+            citizen['relatives'].append(relative['citizen_id'])
+            relative['relatives'].append(citizen['citizen_id'])
+
+    return {'citizens': citizens}
@@ -0,0 +1,86 @@
+"""
+Benchmark of the citizens and relatives access paths on PostgreSQL.
+
+Fills the database with generated imports, prints query plans and timings of the lookups used by the views.
+Everything is done in one transaction which is rolled back at the end, so the database is left untouched.
+Run it before and after the indexes migration to compare plans:
+
+    python -m benchmarks.query_plans --imports 100 --citizens 10000
+"""
+import argparse
+import time
+
+from benchmarks import setup_django
+from benchmarks.generator import generate_citizens
+
+
+class Rollback(Exception):
+    pass
+
+
+def explain(cursor, sql, params):
+    """
+    Print plan of the query with the real execution time.
+    """
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+
+    for row in cursor.fetchall():
+        print('    ' + row[0])
+
+
+def run(imports_count, citizens_count):
+    setup_django()
+
+    from django.db import connection, transaction
+    from django.db.models import Q
+
+    from citizens.ingestion import CitizensImporter
+    from citizens.partitions import create_import_partitions
+    from citizens.models import Citizens, Relatives
+
+    if connection.vendor != 'postgresql':
+        print('Query plans benchmark needs PostgreSQL database')
+        return
+
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+
+            for seed in range(imports_count):
+                importer = CitizensImporter(create_import_partitions())
+                for citizen in generate_citizens(citizens_count, seed=seed)['citizens']:
+                    importer.add(citizen)
+                import_inst = importer.finish()
+
+            print('Filled %d imports of %d citizens in %.1f s' % (imports_count, citizens_count,
+                                                                  time.perf_counter() - start))
+
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE %s, %s' % (Citizens._meta.db_table, Relatives._meta.db_table))
+
+                citizen = Citizens.objects.filter(import_id=import_inst, citizen_id=citizens_count // 2).get()
+
+                queries = (
+                    ('Citizen lookup', Citizens.objects.filter(import_id=import_inst, citizen_id=citizen.citizen_id)),
+                    ('Citizen relatives', Relatives.objects.filter(
+                        Q(citizen_1_id=citizen.id) | Q(citizen_2_id=citizen.id), import_id=import_inst
+                    )),
+                    ('Import relatives', Relatives.objects.filter(import_id=import_inst)),
+                )
+
+                for name, queryset in queries:
+                    print(name)
+                    explain(cursor, *queryset.query.sql_with_params())
+
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imports', type=int, default=100, help='number of generated imports')
+    parser.add_argument('--citizens', type=int, default=10000, help='number of citizens per import')
+    args = parser.parse_args()
+
+    run(args.imports, args.citizens)
@@ -0,0 +1,70 @@
+"""
+Benchmark of the citizens list serialization with the JSON backends.
+
+Rows are built from values_list() tuples of the generated import and encoded to the response body, the database is
+not used. Backends which are not installed are skipped.
+"""
+import argparse
+import time
+from datetime import datetime
+
+from benchmarks import setup_django
+from benchmarks.generator import generate_citizens
+
+
+def get_rows(citizens, fields):
+    """
+    Get values_list() tuples of the generated citizens and the relatives map.
+    """
+    rows = []
+    relatives_map = {}
+
+    for citizen in citizens:
+        citizen = dict(citizen, birth_date=datetime.strptime(citizen['birth_date'], '%d.%m.%Y').date())
+        rows.append(tuple(citizen[field] for field in fields))
+        relatives_map[citizen['citizen_id']] = citizen['relatives']
+
+    return rows, relatives_map
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='numbers of citizens')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best one is reported')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from citizens import serializers
+    from citizens.serializers import BACKENDS, citizen_rows, get_dumps
+    from citizens.views import CitizensList, EncodedJsonStreamingResponse
+
+    backends = [backend for backend in BACKENDS if backend != 'orjson' or serializers.orjson is not None]
+    fields = CitizensList.citizen_fields
+
+    print('%10s %10s %12s %12s %12s' % ('citizens', 'backend', 'response, s', 'stream, s', 'size, MiB'))
+
+    for size in args.sizes:
+        rows, relatives_map = get_rows(generate_citizens(size)['citizens'], fields)
+
+        for backend in backends:
+            dumps = get_dumps(backend)
+            response_time = stream_time = float('inf')
+
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                content = dumps({'data': list(citizen_rows(rows, fields, relatives_map))})
+                response_time = min(response_time, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for _ in EncodedJsonStreamingResponse.iter_content(citizen_rows(rows, fields, relatives_map), dumps,
+                                                                   1000):
+                    pass
+                stream_time = min(stream_time, time.perf_counter() - start)
+
+            print('%10d %10s %12.3f %12.3f %12.2f' % (size, backend, response_time, stream_time,
+                                                      len(content) / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    run()
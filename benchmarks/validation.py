@@ -0,0 +1,52 @@
+"""
+Benchmark of the import payload validation with the functions used by the import view and the import worker.
+
+Time per citizen must stay roughly the same as the import grows, i.e. validation is linear.
+Field checks are also timed in the process pool with the different number of processes.
+"""
+import os
+import time
+
+from benchmarks import setup_django
+from benchmarks.generator import generate_citizens
+
+SIZES = (1000, 10000, 100000)
+
+
+def run():
+    setup_django()
+
+    from django.conf import settings
+
+    from citizens.parallel import iter_valid_citizens
+    from citizens.validators import iter_valid_relatives
+
+    print('%10s %12s %18s' % ('citizens', 'total, s', 'per citizen, us'))
+
+    for size in SIZES:
+        data = generate_citizens(size)
+
+        start = time.perf_counter()
+        for _ in iter_valid_relatives(iter_valid_citizens(data['citizens'])):
+            pass
+        elapsed = time.perf_counter() - start
+
+        print('%10d %12.3f %18.2f' % (size, elapsed, elapsed / size * 10 ** 6))
+
+    citizens = generate_citizens(SIZES[-1])['citizens']
+    print('\nField checks of %d citizens' % len(citizens))
+    print('%10s %12s' % ('processes', 'total, s'))
+
+    for processes in sorted({0, 2, os.cpu_count() or 1}):
+        settings.CITIZENS_VALIDATION_PROCESSES = processes
+
+        start = time.perf_counter()
+        for _ in iter_valid_citizens(citizens):
+            pass
+        elapsed = time.perf_counter() - start
+
+        print('%10d %12.3f' % (processes, elapsed))
+
+
+if __name__ == '__main__':
+    run()
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CitizensConfig(AppConfig):
     name = 'citizens'
+
+    def ready(self):
+        from citizens.db import check_connections
+
+        request_started.connect(check_connections, dispatch_uid='citizens_check_connections')
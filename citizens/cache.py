@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from citizens.compression import get_encoding, compress_response
+from citizens.metrics import phase
+from citizens.models import Imports
+
+CachedResponse = namedtuple('CachedResponse', ('content', 'content_type', 'expires', 'content_encoding'))
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of response bodies with the total size bound.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get not expired CachedResponse by key or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry.expires is not None and entry.expires <= time.time():
+                self.delete(key)
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, content, content_type, expires=None, content_encoding=None):
+        """
+        Cache response content till expires timestamp, evict least recently used entries if cache is full.
+        """
+        if len(content) > self.max_size:
+            return
+
+        with self.lock:
+            self.delete(key)
+
+            self.entries[key] = CachedResponse(content, content_type, expires, content_encoding)
+            self.size += len(content)
+
+            while self.size > self.max_size:
+                self.delete(next(iter(self.entries)))
+
+    def delete(self, key):
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= len(entry.content)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+response_cache = ResponseCache(settings.CITIZENS_RESPONSE_CACHE_SIZE)
+
+
+def get_import_version(import_id):
+    """
+    Get version of the import or None if import does not exist.
+    """
+    return Imports.objects.filter(pk=import_id).values_list('version', flat=True).first()
+
+
+class CachedResponseMixin:
+    """
+    Cache GET responses of the import views by the import version and answer conditional requests with 304.
+    Responses are compressed with the encoding accepted by the client.
+    """
+    # responses depend on the current date and expire at UTC midnight
+    expires_at_midnight = False
+    # version of the requested import, None if it is not known
+    import_version = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+
+        version = self.import_version = get_import_version(kwargs['import_id'])
+        if version is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        etag = '"%d-%d' % (kwargs['import_id'], version)
+        expires = None
+
+        if self.expires_at_midnight:
+            now = timezone.now()
+            etag += '-%s' % now.date().isoformat()
+            expires = (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+        etag += '"'
+
+        # compressed responses have weak ETags, so tags are compared weakly
+        if_none_match = [tag[2:] if tag.startswith('W/') else tag
+                         for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+
+        key = (request.get_full_path(), etag)
+        encoding = get_encoding(request)
+
+        with phase(request, 'cache'):
+            cached = response_cache.get(key + (encoding,)) if encoding is not None else None
+
+            if cached is None:
+                cached = response_cache.get(key)
+
+        if cached is not None:
+            response = HttpResponse(cached.content, content_type=cached.content_type)
+
+            if cached.content_encoding is not None:
+                response['Content-Encoding'] = cached.content_encoding
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+
+            if response.status_code != 200:
+                return response
+
+            if not response.streaming:
+                response_cache.set(key, response.content, response['Content-Type'], expires)
+
+        # the compressed body is cached next to the plain one, so a hot response is compressed once
+        if cached is None or cached.content_encoding is None:
+            response = compress_response(request, response, encoding)
+
+            if not response.streaming and response.has_header('Content-Encoding'):
+                response_cache.set(key + (encoding,), response.content, response['Content-Type'], expires,
+                                   content_encoding=encoding)
+        else:
+            patch_vary_headers(response, ('Accept-Encoding',))
+
+        response['ETag'] = 'W/' + etag if response.has_header('Content-Encoding') else etag
+
+        return response
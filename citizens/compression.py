@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from citizens.metrics import phase
+
+# brotli quality of the responses compressed per request, the best quality 11 is too slow for them
+BROTLI_QUALITY = 5
+
+
+def get_encoding(request):
+    """
+    Get the preferred of CITIZENS_COMPRESSION_ENCODINGS accepted by the client or None.
+    """
+    accepted = {}
+
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.partition(';')
+        params = params.strip()
+        quality = 1.0
+
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+
+        accepted[name.strip().lower()] = quality
+
+    for encoding in settings.CITIZENS_COMPRESSION_ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+
+    return None
+
+
+def compress(content, encoding):
+    """
+    Compress bytes with the encoding.
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+
+    return compress_string(content)
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress iterable of bytes with the encoding while it is sent.
+    """
+    if encoding != 'br':
+        yield from compress_sequence(chunks)
+        return
+
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    for chunk in chunks:
+        data = compressor.process(chunk)
+
+        if data:
+            yield data
+
+    yield compressor.finish()
+
+
+def compress_response(request, response, encoding):
+    """
+    Compress response content with the encoding, small and not shrinking contents are left as is.
+    """
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    if encoding is None or response.has_header('Content-Encoding'):
+        return response
+
+    if response.streaming:
+        response.streaming_content = compress_stream(response.streaming_content, encoding)
+    else:
+        if len(response.content) < settings.CITIZENS_COMPRESSION_MIN_SIZE:
+            return response
+
+        with phase(request, 'compress'):
+            content = compress(response.content, encoding)
+
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+
+    response['Content-Encoding'] = encoding
+
+    return response
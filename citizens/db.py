@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """
+    Close broken persistent database connections before the request, so it opens a new connection instead of failing.
+    """
+    if not settings.CITIZENS_DB_HEALTH_CHECKS:
+        return
+
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict['CONN_MAX_AGE']:
+            continue
+
+        if not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
+
+
+def warm_up_connections():
+    """
+    Open connections to all databases.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()
@@ -0,0 +1,164 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db import connection
+
+from citizens.models import Imports, Citizens, Relatives, BirthdayPresents
+from citizens.stats import get_birth_month, count_presents
+from citizens.validators import parse_birth_date
+
+
+class CitizensImporter:
+    """
+    Write citizens of one import to the database in batches.
+
+    Citizens are buffered and flushed with one bulk INSERT (or PostgreSQL COPY) per batch, relatives and birthday
+    presents are written once all citizens are known. Must be used inside transaction.atomic(), so a failed import
+    leaves no rows.
+
+    If the tables are partitioned, the import id and its partitions are created beforehand by
+    create_import_partitions() and the import row is inserted by finish(), so the imports table is not locked while
+    the citizens are written.
+    """
+    citizen_fields = ('citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender')
+
+    def __init__(self, import_id=None, batch_size=None, use_copy=None, payload_hash=None, idempotency_key=None):
+        if batch_size is None:
+            batch_size = settings.CITIZENS_IMPORT_BATCH_SIZE
+
+        if use_copy is None:
+            use_copy = settings.CITIZENS_IMPORT_USE_COPY
+
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.insert_import = import_id is not None
+
+        if self.insert_import:
+            self.import_inst = Imports(id=import_id, payload_hash=payload_hash, idempotency_key=idempotency_key)
+        else:
+            self.import_inst = Imports.objects.create(payload_hash=payload_hash, idempotency_key=idempotency_key)
+
+        self.buffer = []
+        self.relatives = {}
+        self.birth_months = {}
+        self.ids = {}
+
+    def add(self, citizen):
+        """
+        Add citizen dict to the write buffer, flush the buffer if it is full.
+        """
+        citizen = dict(citizen, birth_date=parse_birth_date(citizen['birth_date']))
+
+        self.relatives[citizen['citizen_id']] = citizen['relatives']
+        self.birth_months[citizen['citizen_id']] = get_birth_month(citizen['birth_date'])
+        self.buffer.append(citizen)
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered citizens to the database.
+        """
+        if not self.buffer:
+            return
+
+        if self.use_copy:
+            self.copy_rows(Citizens, ('import_id',) + self.citizen_fields,
+                           ([self.import_inst.id] + [citizen[field] for field in self.citizen_fields]
+                            for citizen in self.buffer))
+        else:
+            citizen_instances = [
+                Citizens(import_id=self.import_inst, **{field: citizen[field] for field in self.citizen_fields})
+                for citizen in self.buffer
+            ]
+            self.bulk_create(Citizens, citizen_instances)
+
+            if connection.features.can_return_ids_from_bulk_insert:
+                for citizen_inst in citizen_instances:
+                    self.ids[citizen_inst.citizen_id] = citizen_inst.id
+
+        self.buffer = []
+
+    def finish(self):
+        """
+        Flush the rest of citizens, write relatives and presents and return the import instance.
+        """
+        self.flush()
+
+        if len(self.ids) != len(self.relatives):
+            self.ids = dict(Citizens.objects.filter(import_id=self.import_inst).values_list('citizen_id', 'id'))
+
+        relative_pairs = self.get_relative_pairs()
+        ids = self.ids
+
+        if self.use_copy:
+            self.copy_rows(Relatives, ('import_id', 'citizen_1_id', 'citizen_2_id'),
+                           ((self.import_inst.id, ids[citizen_1], ids[citizen_2])
+                            for citizen_1, citizen_2 in relative_pairs))
+        else:
+            self.bulk_create(Relatives, (
+                Relatives(import_id=self.import_inst, citizen_1_id_id=ids[citizen_1], citizen_2_id_id=ids[citizen_2])
+                for citizen_1, citizen_2 in relative_pairs
+            ))
+
+        self.write_presents(count_presents(self.birth_months, relative_pairs))
+
+        if self.insert_import:
+            # foreign keys of the written rows are deferred and checked on commit
+            self.import_inst.save(force_insert=True)
+
+        return self.import_inst
+
+    def get_relative_pairs(self):
+        """
+        Get list of relative pairs of citizen ids, every pair is returned once.
+        """
+        relative_pairs = []
+
+        for citizen_id, relatives in self.relatives.items():
+            for relative in relatives:
+                if relative > citizen_id:
+                    relative_pairs.append((citizen_id, relative))
+
+        return relative_pairs
+
+    def write_presents(self, presents):
+        """
+        Write birthday presents counts of the import.
+        """
+        if self.use_copy:
+            self.copy_rows(BirthdayPresents, ('import_id', 'month', 'citizen_id', 'presents'),
+                           ((self.import_inst.id, month, citizen_id, count)
+                            for (month, citizen_id), count in presents.items()))
+        else:
+            self.bulk_create(BirthdayPresents, (
+                BirthdayPresents(import_id=self.import_inst, month=month, citizen_id=citizen_id, presents=count)
+                for (month, citizen_id), count in presents.items()
+            ))
+
+    def bulk_create(self, model, instances):
+        """
+        Insert instances in batches no bigger than the database allows.
+        """
+        instances = list(instances)
+        max_batch_size = connection.ops.bulk_batch_size(model._meta.concrete_fields, instances)
+
+        model.objects.bulk_create(instances, batch_size=max(min(self.batch_size, max_batch_size), 1))
+
+    @staticmethod
+    def copy_rows(model, field_names, rows):
+        """
+        Write rows to the table of model with PostgreSQL COPY. Errors of COPY are raised as Django database errors
+        like errors of the other queries.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in field_names)
+        sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (connection.ops.quote_name(model._meta.db_table), columns)
+
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.copy_expert(sql, buffer)
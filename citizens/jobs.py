@@ -0,0 +1,113 @@
+import hashlib
+import io
+from datetime import timedelta
+from json import JSONDecodeError
+
+from django.conf import settings
+from django.db import transaction, DataError, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from citizens.models import Citizens, ImportJobs
+from citizens.parallel import iter_valid_citizens
+from citizens.streaming import iter_import_citizens
+from citizens.validators import InvalidImportError, iter_valid_relatives
+from citizens.views import ImportsView
+
+
+def claim_job():
+    """
+    Take the oldest pending job and mark it as being validated. Jobs which are validated or written for more than
+    CITIZENS_IMPORT_JOB_TIMEOUT seconds were abandoned by a killed worker and are taken again. Return None if there
+    are no such jobs.
+    """
+    now = timezone.now()
+    abandoned = Q(status__in=(ImportJobs.STATUS_VALIDATING, ImportJobs.STATUS_WRITING),
+                  started_at__lt=now - timedelta(seconds=settings.CITIZENS_IMPORT_JOB_TIMEOUT))
+
+    with transaction.atomic():
+        job = ImportJobs.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ImportJobs.STATUS_PENDING) | abandoned
+        ).order_by('id').first()
+
+        if job is not None:
+            job.status = ImportJobs.STATUS_VALIDATING
+            job.started_at = now
+            job.attempts += 1
+            job.save(update_fields=('status', 'started_at', 'attempts'))
+
+    return job
+
+
+def process_job(job):
+    """
+    Validate the job payload, then write it in one transaction without validating it again. Progress is saved to
+    the job while validating, outside of the import transaction, so it is seen before the import is committed.
+    Unexpected errors fail the job and are raised to be reported by the worker.
+    """
+    if job.attempts > settings.CITIZENS_IMPORT_JOB_MAX_ATTEMPTS:
+        # workers were killed while processing the job too many times
+        job.status = ImportJobs.STATUS_FAILED
+        finish_job(job)
+        return
+
+    payload_hash = hashlib.sha256(job.payload).hexdigest()
+
+    try:
+        # the same payload or the idempotency key may be already imported by a retried request
+        job.import_id = ImportsView.get_existing_import(payload_hash, job.idempotency_key)
+
+        if job.import_id is None:
+            validate_payload(job)
+
+            job.status = ImportJobs.STATUS_WRITING
+            job.save(update_fields=('status',))
+
+            job.import_id = ImportsView.import_citizens(iter_import_citizens(io.BytesIO(job.payload)), payload_hash,
+                                                        job.idempotency_key, validate=False)
+        else:
+            job.citizens_count = Citizens.objects.filter(import_id=job.import_id).count()
+
+        job.status = ImportJobs.STATUS_DONE
+    except (JSONDecodeError, InvalidImportError, DataError):
+        job.status = ImportJobs.STATUS_FAILED
+    except IntegrityError:
+        job.import_id = ImportsView.get_existing_import(payload_hash, job.idempotency_key)
+        job.status = ImportJobs.STATUS_DONE if job.import_id is not None else ImportJobs.STATUS_FAILED
+    except Exception:
+        job.import_id = None
+        job.status = ImportJobs.STATUS_FAILED
+        finish_job(job)
+        raise
+
+    if job.import_id is not None and job.import_id.payload_hash != payload_hash:
+        # the idempotency key was used for another payload by a synchronous import
+        job.import_id = None
+        job.status = ImportJobs.STATUS_FAILED
+
+    finish_job(job)
+
+
+def finish_job(job):
+    """
+    Save the final status of the job and drop its payload.
+    """
+    job.payload = b''
+    job.finished_at = timezone.now()
+    job.save()
+
+
+def validate_payload(job):
+    """
+    Check the job payload without writing it. Raise InvalidImportError if it is not valid.
+    """
+    citizens_count = 0
+
+    for _ in iter_valid_relatives(iter_valid_citizens(iter_import_citizens(io.BytesIO(job.payload)))):
+        citizens_count += 1
+        if citizens_count % settings.CITIZENS_IMPORT_JOB_PROGRESS_STEP == 0:
+            job.citizens_count = citizens_count
+            job.save(update_fields=('citizens_count',))
+
+    job.citizens_count = citizens_count
+    job.save(update_fields=('citizens_count',))
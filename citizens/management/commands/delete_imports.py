@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand, CommandError
+
+from citizens.retention import get_expired_imports, delete_import
+
+
+class Command(BaseCommand):
+    help = 'Delete imports except the latest ones and the ones newer than the given age'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-last', type=int, help='number of the latest imports which are kept')
+        parser.add_argument('--max-age', type=float, help='imports newer than this number of days are kept')
+        parser.add_argument('--dry-run', action='store_true', help='only print imports which would be deleted')
+
+    def handle(self, *args, **options):
+        if options['keep_last'] is None and options['max_age'] is None:
+            raise CommandError('Pass --keep-last or --max-age')
+
+        for import_id in get_expired_imports(options['keep_last'], options['max_age']):
+            if options['dry_run']:
+                self.stdout.write('Import %d would be deleted' % import_id)
+            elif delete_import(import_id):
+                self.stdout.write('Import %d deleted' % import_id)
@@ -0,0 +1,34 @@
+import time
+import traceback
+
+from django.core.management import BaseCommand
+
+from citizens.jobs import claim_job, process_job
+
+
+class Command(BaseCommand):
+    help = 'Process imports accepted in the asynchronous mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='process pending jobs and exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='seconds between checks for new jobs')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+
+            if job is None:
+                if options['once']:
+                    break
+
+                time.sleep(options['interval'])
+                continue
+
+            try:
+                process_job(job)
+            except Exception:
+                # the job is failed or, if it could not be saved, claimed again after CITIZENS_IMPORT_JOB_TIMEOUT
+                self.stderr.write('Import job %d: %s\n%s' % (job.id, job.status, traceback.format_exc()))
+                continue
+
+            self.stdout.write('Import job %d: %s' % (job.id, job.status))
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# upper bounds in seconds of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class RequestMetrics:
+    """
+    Phase timings and SQL queries of one request.
+    Instance is also a database execute wrapper which counts queries and their time.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        self.sql_time = 0.0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def get_server_timing(self, total):
+        """
+        Get value of Server-Timing header, durations are in milliseconds.
+        """
+        timings = ['%s;dur=%.1f' % (name, duration * 1000) for name, duration in self.phases.items()]
+        timings.append('db;dur=%.1f;desc="%d queries"' % (self.sql_time * 1000, self.queries))
+        timings.append('total;dur=%.1f' % (total * 1000))
+
+        return ', '.join(timings)
+
+
+@contextmanager
+def phase(request, name):
+    """
+    Measure the phase of the request if metrics are collected for it.
+    """
+    metrics = getattr(request, 'metrics', None)
+
+    if metrics is None:
+        yield
+    else:
+        with metrics.phase(name):
+            yield
+
+
+class EndpointMetrics:
+    """
+    Aggregated metrics of the endpoint requests.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.phases = defaultdict(float)
+
+
+class MetricsRegistry:
+    """
+    Per-process metrics of all endpoints.
+    """
+
+    def __init__(self):
+        self.endpoints = defaultdict(EndpointMetrics)
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint, duration, request_metrics):
+        with self.lock:
+            metrics = self.endpoints[endpoint]
+
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[index] += 1
+                    break
+
+            metrics.count += 1
+            metrics.duration += duration
+            metrics.queries += request_metrics.queries
+            metrics.sql_time += request_metrics.sql_time
+
+            for name, phase_duration in request_metrics.phases.items():
+                metrics.phases[name] += phase_duration
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        """
+        Render metrics in the Prometheus text format.
+        """
+        lines = [
+            '# TYPE citizens_request_duration_seconds histogram',
+        ]
+        counters = {
+            'citizens_request_queries_total': [],
+            'citizens_request_sql_seconds_total': [],
+            'citizens_request_phase_seconds_total': [],
+        }
+
+        with self.lock:
+            for endpoint, metrics in sorted(self.endpoints.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('citizens_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d'
+                                 % (endpoint, le, cumulative))
+
+                lines.append('citizens_request_duration_seconds_sum{endpoint="%s"} %f' % (endpoint, metrics.duration))
+                lines.append('citizens_request_duration_seconds_count{endpoint="%s"} %d' % (endpoint, metrics.count))
+
+                counters['citizens_request_queries_total'].append(
+                    'citizens_request_queries_total{endpoint="%s"} %d' % (endpoint, metrics.queries)
+                )
+                counters['citizens_request_sql_seconds_total'].append(
+                    'citizens_request_sql_seconds_total{endpoint="%s"} %f' % (endpoint, metrics.sql_time)
+                )
+                for name, duration in sorted(metrics.phases.items()):
+                    counters['citizens_request_phase_seconds_total'].append(
+                        'citizens_request_phase_seconds_total{endpoint="%s",phase="%s"} %f' % (endpoint, name, duration)
+                    )
+
+        for name, counter_lines in counters.items():
+            lines.append('# TYPE %s counter' % name)
+            lines.extend(counter_lines)
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,32 @@
+import time
+
+from django.db import connection
+
+from citizens.metrics import RequestMetrics, registry
+
+
+class MetricsMiddleware:
+    """
+    Measure request phases and SQL queries, send them in the Server-Timing header and aggregate them by endpoint.
+    Queries of streaming responses made after the view returned are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - start
+
+        response['Server-Timing'] = metrics.get_server_timing(duration)
+
+        resolver_match = request.resolver_match
+        endpoint = resolver_match.view_name if resolver_match is not None else 'unknown'
+        registry.observe(endpoint, duration, metrics)
+
+        return response
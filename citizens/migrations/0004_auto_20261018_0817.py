@@ -0,0 +1,55 @@
+# Generated by Django 2.2.4 on 2026-10-18 08:17
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_birthday_presents(apps, schema_editor):
+    """
+    Count presents of the existing imports.
+    """
+    Relatives = apps.get_model('citizens', 'Relatives')
+    BirthdayPresents = apps.get_model('citizens', 'BirthdayPresents')
+
+    relatives = Relatives.objects.values_list(
+        'import_id', 'citizen_1_id__citizen_id', 'citizen_1_id__birth_date', 'citizen_2_id__citizen_id',
+        'citizen_2_id__birth_date'
+    ).iterator()
+
+    presents = Counter()
+    for import_id, citizen_1, birth_date_1, citizen_2, birth_date_2 in relatives:
+        presents[(import_id, int(birth_date_1[3:5]), citizen_2)] += 1
+        presents[(import_id, int(birth_date_2[3:5]), citizen_1)] += 1
+
+    BirthdayPresents.objects.bulk_create(
+        (BirthdayPresents(import_id_id=import_id, month=month, citizen_id=citizen_id, presents=count)
+         for (import_id, month, citizen_id), count in presents.items()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0003_auto_20190825_0858'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BirthdayPresents',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.PositiveSmallIntegerField()),
+                ('citizen_id', models.PositiveIntegerField()),
+                ('presents', models.PositiveIntegerField()),
+                ('import_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='citizens.Imports')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='birthdaypresents',
+            constraint=models.UniqueConstraint(fields=('import_id', 'month', 'citizen_id'), name='birthday_presents_unique'),
+        ),
+        migrations.RunPython(fill_birthday_presents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 2.2.4 on 2026-10-18 09:05
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+# number of citizens read and converted at once on databases other than PostgreSQL
+BATCH_SIZE = 1000
+
+
+def convert_birth_dates(Citizens, source, target, convert):
+    """
+    Set target field of all citizens to the converted source field, citizens are read and written in batches.
+    """
+    last_id = 0
+
+    while True:
+        citizens = list(Citizens.objects.filter(id__gt=last_id).order_by('id').only('id', source)[:BATCH_SIZE])
+
+        if not citizens:
+            break
+
+        for citizen in citizens:
+            setattr(citizen, target, convert(getattr(citizen, source)))
+
+        Citizens.objects.bulk_update(citizens, (target,))
+        last_id = citizens[-1].id
+
+
+def birth_date_to_date(apps, schema_editor):
+    """
+    Convert 'DD.MM.YYYY' birth dates to dates.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("UPDATE citizens_citizens SET birth_date_new = to_date(birth_date, 'DD.MM.YYYY')")
+        return
+
+    convert_birth_dates(apps.get_model('citizens', 'Citizens'), 'birth_date', 'birth_date_new',
+                        lambda birth_date: datetime.strptime(birth_date, '%d.%m.%Y').date())
+
+
+def birth_date_to_str(apps, schema_editor):
+    """
+    Convert birth dates back to 'DD.MM.YYYY' strings.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("UPDATE citizens_citizens SET birth_date = to_char(birth_date_new, 'DD.MM.YYYY')")
+        return
+
+    convert_birth_dates(apps.get_model('citizens', 'Citizens'), 'birth_date_new', 'birth_date',
+                        lambda birth_date: '%02d.%02d.%04d' % (birth_date.day, birth_date.month, birth_date.year))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0004_auto_20261018_0817'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citizens',
+            name='birth_date_new',
+            field=models.DateField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='citizens',
+            name='birth_date',
+            field=models.CharField(max_length=20, null=True),
+        ),
+        migrations.RunPython(birth_date_to_date, birth_date_to_str),
+        migrations.RemoveField(
+            model_name='citizens',
+            name='birth_date',
+        ),
+        migrations.RenameField(
+            model_name='citizens',
+            old_name='birth_date_new',
+            new_name='birth_date',
+        ),
+        migrations.AlterField(
+            model_name='citizens',
+            name='birth_date',
+            field=models.DateField(),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.4 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0005_auto_20261018_0905'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='relatives',
+            index=models.Index(fields=['import_id', 'citizen_1_id'], name='relatives_import_citizen_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatives',
+            index=models.Index(fields=['import_id', 'citizen_2_id'], name='relatives_import_citizen_2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='citizens',
+            constraint=models.UniqueConstraint(fields=('import_id', 'citizen_id'), name='citizens_import_citizen_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0006_auto_20261018_0920'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imports',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.4 on 2026-10-18 08:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0007_imports_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJobs',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('validating', 'validating'), ('writing', 'writing'), ('done', 'done'), ('failed', 'failed')], db_index=True, default='pending', max_length=10)),
+                ('citizens_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('import_id', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='citizens.Imports')),
+            ],
+        ),
+    ]
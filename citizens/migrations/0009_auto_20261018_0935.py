@@ -0,0 +1,23 @@
+# Generated by Django 2.2.4 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0008_importjobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imports',
+            name='idempotency_key',
+            field=models.CharField(max_length=256, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='imports',
+            name='payload_hash',
+            field=models.CharField(max_length=64, null=True, unique=True),
+        ),
+    ]
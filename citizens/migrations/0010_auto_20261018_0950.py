@@ -0,0 +1,104 @@
+# Generated by Django 2.2.4 on 2026-10-18 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PARTITIONED_TABLES = ('citizens_citizens', 'citizens_relatives')
+PARTITION_KEY = 'import_id_id'
+
+
+def can_partition(connection):
+    """
+    Declarative partitioning with primary and foreign keys on partitioned tables needs PostgreSQL 11.
+    """
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def rebuild_table(schema_editor, table, partitioned):
+    """
+    Recreate the table as partitioned by import_id or as a plain table, move its rows and constraints.
+    Primary key of a partitioned table has to include the partition key, so it is (id, import_id).
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    old_table = table + '_old'
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE %s RENAME TO %s' % (quote(table), quote(old_table)))
+        cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)%s' % (
+            quote(table), quote(old_table), ' PARTITION BY LIST (%s)' % quote(PARTITION_KEY) if partitioned else ''
+        ))
+        cursor.execute('ALTER SEQUENCE %s OWNED BY %s.%s' % (sequence, quote(table), quote('id')))
+
+        if partitioned:
+            cursor.execute('SELECT id FROM citizens_imports')
+
+            for import_id, in cursor.fetchall():
+                cursor.execute('CREATE TABLE %s PARTITION OF %s FOR VALUES IN (%d)' % (
+                    quote('%s_%d' % (table, import_id)), quote(table), import_id
+                ))
+
+        cursor.execute('INSERT INTO %s SELECT * FROM %s' % (quote(table), quote(old_table)))
+        cursor.execute('DROP TABLE %s' % quote(old_table))
+
+        for name, constraint in constraints.items():
+            columns = ', '.join(quote(column) for column in constraint['columns'])
+
+            if constraint['primary_key']:
+                columns = quote('id') + (', ' + quote(PARTITION_KEY) if partitioned else '')
+                cursor.execute('ALTER TABLE %s ADD CONSTRAINT %s PRIMARY KEY (%s)' % (quote(table), quote(name),
+                                                                                     columns))
+            elif constraint['foreign_key']:
+                to_table, to_column = constraint['foreign_key']
+                cursor.execute(
+                    'ALTER TABLE %s ADD CONSTRAINT %s FOREIGN KEY (%s) REFERENCES %s (%s) DEFERRABLE INITIALLY DEFERRED'
+                    % (quote(table), quote(name), columns, quote(to_table), quote(to_column))
+                )
+            elif constraint['unique']:
+                cursor.execute('ALTER TABLE %s ADD CONSTRAINT %s UNIQUE (%s)' % (quote(table), quote(name), columns))
+            elif constraint['index']:
+                cursor.execute('CREATE INDEX %s ON %s (%s)' % (quote(name), quote(table), columns))
+
+
+def partition_tables(apps, schema_editor):
+    """
+    Partition citizens and relatives tables by import_id on PostgreSQL, other databases are left as is.
+    """
+    if can_partition(schema_editor.connection):
+        for table in PARTITIONED_TABLES:
+            rebuild_table(schema_editor, table, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    """
+    Turn partitioned citizens and relatives tables back to plain tables.
+    """
+    if can_partition(schema_editor.connection):
+        for table in PARTITIONED_TABLES:
+            rebuild_table(schema_editor, table, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0009_auto_20261018_0935'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='relatives',
+            name='citizen_1_id',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='citizen_1_id', to='citizens.Citizens'),
+        ),
+        migrations.AlterField(
+            model_name='relatives',
+            name='citizen_2_id',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='citizen_2_id', to='citizens.Citizens'),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
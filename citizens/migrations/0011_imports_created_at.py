@@ -0,0 +1,20 @@
+# Generated by Django 2.2.4 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0010_auto_20261018_0950'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imports',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.4 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0011_imports_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobs',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjobs',
+            name='started_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
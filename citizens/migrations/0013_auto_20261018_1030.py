@@ -0,0 +1,23 @@
+# Generated by Django 2.2.4 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizens', '0012_auto_20261018_1020'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobs',
+            name='idempotency_key',
+            field=models.CharField(max_length=256, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='importjobs',
+            name='payload_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
@@ -2,7 +2,12 @@ from django.db import models
 
 
 class Imports(models.Model):
-    pass
+    # incremented on every change of the import citizens
+    version = models.PositiveIntegerField(default=1)
+    # sha256 of the imported payload and Idempotency-Key header of the request, repeated imports return this import
+    payload_hash = models.CharField(max_length=64, null=True, unique=True)
+    idempotency_key = models.CharField(max_length=256, null=True, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
 
 class Citizens(models.Model):
@@ -13,11 +18,67 @@ class Citizens(models.Model):
     building = models.CharField(max_length=256)
     apartment = models.PositiveIntegerField()
     name = models.CharField(max_length=256)
-    birth_date = models.CharField(max_length=20)
+    birth_date = models.DateField()
     gender = models.CharField(max_length=10, choices=(('male', 'male'), ('female', 'female')))
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('import_id', 'citizen_id'), name='citizens_import_citizen_unique'),
+        ]
+
 
 class Relatives(models.Model):
     import_id = models.ForeignKey('citizens.Imports', on_delete=models.CASCADE)
-    citizen_1_id = models.ForeignKey('citizens.Citizens', on_delete=models.CASCADE, related_name='citizen_1_id')
-    citizen_2_id = models.ForeignKey('citizens.Citizens', on_delete=models.CASCADE, related_name='citizen_2_id')
+    # PostgreSQL can not reference the partitioned citizens table by id, relatives are checked on import and update
+    citizen_1_id = models.ForeignKey('citizens.Citizens', on_delete=models.CASCADE, related_name='citizen_1_id',
+                                     db_constraint=False)
+    citizen_2_id = models.ForeignKey('citizens.Citizens', on_delete=models.CASCADE, related_name='citizen_2_id',
+                                     db_constraint=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('import_id', 'citizen_1_id'), name='relatives_import_citizen_1_idx'),
+            models.Index(fields=('import_id', 'citizen_2_id'), name='relatives_import_citizen_2_idx'),
+        ]
+
+
+class BirthdayPresents(models.Model):
+    """
+    Number of presents citizen buys to his relatives born in the month. Maintained on import and citizen changes.
+    """
+    import_id = models.ForeignKey('citizens.Imports', on_delete=models.CASCADE)
+    month = models.PositiveSmallIntegerField()
+    citizen_id = models.PositiveIntegerField()
+    presents = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('import_id', 'month', 'citizen_id'), name='birthday_presents_unique'),
+        ]
+
+
+class ImportJobs(models.Model):
+    """
+    Import accepted for the background processing by the import worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_VALIDATING = 'validating'
+    STATUS_WRITING = 'writing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    payload = models.BinaryField()
+    # sha256 of the payload and Idempotency-Key header of the request, repeated requests with the key get this job
+    payload_hash = models.CharField(max_length=64, null=True)
+    idempotency_key = models.CharField(max_length=256, null=True, unique=True)
+    status = models.CharField(max_length=10, default=STATUS_PENDING, db_index=True, choices=(
+        (STATUS_PENDING, STATUS_PENDING), (STATUS_VALIDATING, STATUS_VALIDATING), (STATUS_WRITING, STATUS_WRITING),
+        (STATUS_DONE, STATUS_DONE), (STATUS_FAILED, STATUS_FAILED),
+    ))
+    citizens_count = models.PositiveIntegerField(default=0)
+    import_id = models.ForeignKey('citizens.Imports', on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # time the job was last claimed by a worker and number of times it was claimed
+    started_at = models.DateTimeField(null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True)
@@ -0,0 +1,98 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice, chain
+
+from django.conf import settings
+
+from citizens.validators import InvalidImportError, citizens_are_valid
+
+pools = {}
+
+
+def get_pool(processes):
+    """
+    Get process pool of the worker process, pools are created on the first use.
+    """
+    pool = pools.get(processes)
+
+    if pool is None:
+        pool = pools[processes] = ProcessPoolExecutor(processes)
+
+    return pool
+
+
+def drop_pool(processes):
+    """
+    Drop the pool of the worker process, the next import creates a new one.
+    """
+    pool = pools.pop(processes, None)
+
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def iter_valid_citizens(citizens):
+    """
+    Yield citizens checked by the field rules, raise InvalidImportError on the first invalid citizen.
+
+    Citizens are checked in chunks. If there is more than one chunk and CITIZENS_VALIDATION_PROCESSES is set,
+    chunks are checked in the process pool while the previous ones are being written. If a process of the pool
+    dies, the pool is dropped and the rest of chunks is checked in this process.
+    """
+    processes = settings.CITIZENS_VALIDATION_PROCESSES
+    chunk_size = settings.CITIZENS_VALIDATION_CHUNK_SIZE
+
+    citizens = iter(citizens)
+    chunks = iter(lambda: list(islice(citizens, chunk_size)), [])
+    first_chunks = list(islice(chunks, 2))
+
+    if not processes or len(first_chunks) < 2:
+        yield from iter_checked_chunks(chain(first_chunks, chunks))
+        return
+
+    pool = get_pool(processes)
+    chunks = chain(first_chunks, chunks)
+    # chunks being checked and their futures, a chunk is removed once its future is done
+    pending = deque()
+    futures = deque()
+
+    try:
+        while True:
+            # keep the pool busy, but do not read more than two chunks per process ahead
+            while len(pending) < processes * 2:
+                citizen_chunk = next(chunks, None)
+                if citizen_chunk is None:
+                    break
+
+                pending.append(citizen_chunk)
+                futures.append(pool.submit(citizens_are_valid, citizen_chunk))
+
+            if not pending:
+                break
+
+            is_valid = futures[0].result()
+            citizen_chunk = pending.popleft()
+            futures.popleft()
+
+            if not is_valid:
+                for future in futures:
+                    future.cancel()
+
+                raise InvalidImportError
+
+            yield from citizen_chunk
+    except BrokenProcessPool:
+        drop_pool(processes)
+        yield from iter_checked_chunks(chain(pending, chunks))
+
+
+def iter_checked_chunks(chunks):
+    """
+    Yield citizens of the chunks checked in this process, raise InvalidImportError on the first invalid chunk.
+    """
+    for citizen_chunk in chunks:
+        if not citizens_are_valid(citizen_chunk):
+            raise InvalidImportError
+
+        yield from citizen_chunk
@@ -0,0 +1,73 @@
+from django.db import connection, transaction
+
+from citizens.models import Imports, Citizens, Relatives
+
+# tables partitioned by import_id on PostgreSQL 11+, every import has its own partition of each of them
+PARTITIONED_MODELS = (Citizens, Relatives)
+
+partitioning = {}
+
+
+def partitioning_enabled():
+    """
+    Check if the citizens tables are partitioned, the result is cached for the process. PostgreSQL before 10 has
+    no declarative partitioning, its tables are never partitioned.
+    """
+    if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+        return False
+
+    if 'enabled' not in partitioning:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+                           [Citizens._meta.db_table])
+            partitioning['enabled'] = cursor.fetchone()[0]
+
+    return partitioning['enabled']
+
+
+def get_partition_name(model, import_id):
+    return '%s_%d' % (model._meta.db_table, import_id)
+
+
+def create_import_partitions():
+    """
+    Reserve an id for a new import and create its partitions in a separate transaction, return None if the tables
+    are not partitioned.
+
+    Partitions are created before the import is written and committed at once: attaching a partition locks the
+    partitioned table and the imports table, so the locks must not be held until the whole import is written.
+    CREATE TABLE ... PARTITION OF would lock the partitioned table against reads, ATTACH PARTITION does not on
+    PostgreSQL 12+.
+    """
+    if not partitioning_enabled():
+        return None
+
+    quote = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s))', [Imports._meta.db_table, 'id'])
+        import_id = cursor.fetchone()[0]
+
+        for model in PARTITIONED_MODELS:
+            partition = quote(get_partition_name(model, import_id))
+            table = quote(model._meta.db_table)
+
+            cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' % (partition, table))
+            cursor.execute('ALTER TABLE %s ATTACH PARTITION %s FOR VALUES IN (%d)' % (table, partition, import_id))
+
+    return import_id
+
+
+def drop_partitions(import_id):
+    """
+    Drop partitions of the import in a separate transaction, dropping a partition locks the partitioned table.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # a table with deferred foreign key checks pending in the transaction can not be dropped
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        for model in PARTITIONED_MODELS:
+            cursor.execute('DROP TABLE IF EXISTS %s' % connection.ops.quote_name(get_partition_name(model, import_id)))
+
+        # the mode lasts until the end of an outer transaction, foreign keys created by Django are deferred
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
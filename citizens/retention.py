@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from citizens.models import Imports, Citizens, Relatives, BirthdayPresents, ImportJobs
+from citizens.partitions import PARTITIONED_MODELS, partitioning_enabled, drop_partitions
+
+
+def delete_import(import_id):
+    """
+    Delete the import with all its rows, return False if it does not exist.
+
+    Rows are deleted with one statement per table instead of the Django cascade which loads them. If the tables are
+    partitioned, partitions of the import are dropped and committed first, dropping them locks the partitioned
+    tables, so the lock is not held while the other rows are deleted.
+    """
+    partitioned = partitioning_enabled()
+
+    if partitioned:
+        with transaction.atomic():
+            if not Imports.objects.select_for_update().filter(pk=import_id).exists():
+                return False
+
+            drop_partitions(import_id)
+
+    with transaction.atomic():
+        if not Imports.objects.select_for_update().filter(pk=import_id).exists():
+            return False
+
+        ImportJobs.objects.filter(import_id=import_id).update(import_id=None)
+
+        quote = connection.ops.quote_name
+
+        with connection.cursor() as cursor:
+            for model in (Relatives, Citizens, BirthdayPresents, Imports):
+                if model in PARTITIONED_MODELS and partitioned:
+                    continue
+
+                column = model._meta.pk.column if model is Imports else model._meta.get_field('import_id').column
+                cursor.execute('DELETE FROM %s WHERE %s = %%s' % (quote(model._meta.db_table), quote(column)),
+                               [import_id])
+
+    return True
+
+
+def get_expired_imports(keep_last=None, max_age=None):
+    """
+    Get ids of the imports which are neither among keep_last latest imports nor newer than max_age days.
+    """
+    imports = Imports.objects.order_by('-id')
+
+    if keep_last is not None:
+        imports = imports.exclude(pk__in=Imports.objects.order_by('-id').values('pk')[:keep_last])
+
+    if max_age is not None:
+        imports = imports.filter(created_at__lt=timezone.now() - timedelta(days=max_age))
+
+    return list(imports.values_list('id', flat=True))
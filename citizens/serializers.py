@@ -0,0 +1,70 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from citizens.validators import format_birth_date
+
+
+def dumps_json(data):
+    """
+    Encode data to utf8 JSON bytes with the standard library.
+    """
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+
+
+def dumps_orjson(data):
+    """
+    Encode data to utf8 JSON bytes with orjson, types unknown to it are encoded like DjangoJSONEncoder does.
+    """
+    return orjson.dumps(data, default=DjangoJSONEncoder().default)
+
+
+BACKENDS = {
+    'json': dumps_json,
+    'orjson': dumps_orjson,
+}
+
+
+def get_dumps(backend=None):
+    """
+    Get encoding function of the JSON backend, the standard library is used if the backend is not installed.
+    """
+    if backend is None:
+        backend = settings.CITIZENS_JSON_BACKEND
+
+    if backend == 'orjson' and orjson is None:
+        return dumps_json
+
+    return BACKENDS[backend]
+
+
+def dumps(data, backend=None):
+    """
+    Encode data to utf8 JSON bytes with the configured backend.
+    """
+    return get_dumps(backend)(data)
+
+
+def citizen_rows(citizens, fields, relatives_map=None, key_index=0):
+    """
+    Yield citizen dicts built from values_list() tuples of fields with formatted birth_date and relatives lists.
+    Tuples may have extra values after the fields, relatives are looked up by citizen_id at key_index of the tuple.
+    """
+    birth_date_index = fields.index('birth_date') if 'birth_date' in fields else None
+
+    for row in citizens:
+        citizen = dict(zip(fields, row))
+
+        if birth_date_index is not None:
+            citizen['birth_date'] = format_birth_date(row[birth_date_index])
+
+        if relatives_map is not None:
+            citizen['relatives'] = relatives_map.get(row[key_index], [])
+
+        yield citizen
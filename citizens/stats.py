@@ -0,0 +1,163 @@
+from collections import Counter
+from datetime import timedelta
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from citizens.models import BirthdayPresents, Citizens
+
+
+def get_birth_month(birth_date):
+    """
+    Get month number of birth date.
+    """
+    return birth_date.month
+
+
+def count_presents(birth_months, relative_pairs):
+    """
+    Count presents of the citizens by month.
+    :param birth_months: dict of birth months by citizen_id
+    :param relative_pairs: iterable of (citizen_id, citizen_id) pairs, every relation is passed once
+    :return: Counter of presents by (month, citizen_id)
+    """
+    presents = Counter()
+
+    for citizen_1, citizen_2 in relative_pairs:
+        presents[(birth_months[citizen_1], citizen_2)] += 1
+        presents[(birth_months[citizen_2], citizen_1)] += 1
+
+    return presents
+
+
+def update_presents(import_id, delta):
+    """
+    Apply presents delta to the stored presents of the import with a constant number of queries. Must be called
+    with the import row locked, like CitizensUpdater does, so concurrent deltas are applied one after another.
+    """
+    if not delta:
+        return
+
+    citizen_ids = {citizen_id for month, citizen_id in delta}
+    stored_presents = {
+        (presents.month, presents.citizen_id): presents
+        for presents in BirthdayPresents.objects.filter(import_id=import_id, citizen_id__in=citizen_ids)
+    }
+
+    changed_presents = []
+    new_presents = []
+    removed_pks = []
+
+    for (month, citizen_id), count in delta.items():
+        presents = stored_presents.get((month, citizen_id))
+
+        if presents is None:
+            new_presents.append(BirthdayPresents(import_id_id=import_id, month=month, citizen_id=citizen_id,
+                                                 presents=count))
+        elif presents.presents + count == 0:
+            removed_pks.append(presents.id)
+        else:
+            presents.presents += count
+            changed_presents.append(presents)
+
+    BirthdayPresents.objects.bulk_update(changed_presents, ('presents',))
+    BirthdayPresents.objects.bulk_create(new_presents)
+
+    if removed_pks:
+        BirthdayPresents.objects.filter(id__in=removed_pks).delete()
+
+
+def get_age_percentiles(import_id, version=None):
+    """
+    Get age percentiles p50, p75, p99 of the import citizens by town.
+    Ages only change when UTC day changes, so the result of the import version is cached till the end of the day.
+    Changed imports get a new version, so their cached results are not used by any worker. Nothing is cached if
+    the version is not known.
+    """
+    now = timezone.now()
+    today = now.date()
+
+    if version is None:
+        return count_import_age_percentiles(import_id, today)
+
+    key = get_age_percentiles_key(import_id, version, today)
+
+    data = cache.get(key)
+    if data is None:
+        data = count_import_age_percentiles(import_id, today)
+
+        if data:
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            cache.set(key, data, (midnight - now).total_seconds())
+
+    return data
+
+
+def count_import_age_percentiles(import_id, today):
+    """
+    Count age percentiles of the import in PostgreSQL if CITIZENS_AGE_PERCENTILES_BACKEND is 'database', otherwise
+    with numpy from the citizens rows.
+    """
+    if settings.CITIZENS_AGE_PERCENTILES_BACKEND == 'database' and connection.vendor == 'postgresql':
+        return count_database_age_percentiles(import_id, today)
+
+    citizens = Citizens.objects.filter(import_id=import_id).values_list('birth_date', 'town')
+    birth_dates, towns = zip(*citizens) if citizens else ((), ())
+
+    return count_age_percentiles(birth_dates, towns, today)
+
+
+def count_database_age_percentiles(import_id, today):
+    """
+    Count age percentiles by town with percentile_cont in PostgreSQL, only one row per town is fetched.
+    percentile_cont interpolates linearly like numpy, towns are sorted and values are rounded here, so the result
+    does not depend on the database collation.
+    """
+    quote = connection.ops.quote_name
+    sql = (
+        'SELECT {town}, percentile_cont(ARRAY[0.5, 0.75, 0.99]) WITHIN GROUP '
+        '(ORDER BY (%s::date - {birth_date})::double precision / 365.25) '
+        'FROM {table} WHERE {import_id} = %s GROUP BY {town}'
+    ).format(town=quote(Citizens._meta.get_field('town').column),
+             birth_date=quote(Citizens._meta.get_field('birth_date').column),
+             table=quote(Citizens._meta.db_table), import_id=quote(Citizens._meta.get_field('import_id').column))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [today, import_id])
+        rows = cursor.fetchall()
+
+    return [get_percentiles_row(town, p50, p75, p99) for town, (p50, p75, p99) in sorted(rows)]
+
+
+def get_percentiles_row(town, p50, p75, p99):
+    return {'town': town, 'p50': float('%.2f' % p50), 'p75': float('%.2f' % p75), 'p99': float('%.2f' % p99)}
+
+
+def get_age_percentiles_key(import_id, version, day):
+    return 'age_percentiles:%d:%d:%s' % (import_id, version, day.isoformat())
+
+
+def count_age_percentiles(birth_dates, towns, today):
+    """
+    Count age percentiles by town with one numpy percentile call per town.
+    Age is a number of years between birth date and the start of today.
+    :return: list of {'town': town, 'p50': p50, 'p75': p75, 'p99': p99} dicts ordered by town
+    """
+    if not birth_dates:
+        return []
+
+    birth_days = numpy.array(birth_dates, dtype='datetime64[D]')
+    ages = (numpy.datetime64(today, 'D') - birth_days).astype(numpy.float64) / 365.25
+
+    town_names, town_indexes = numpy.unique(numpy.array(towns, dtype=object), return_inverse=True)
+    town_ages = numpy.split(ages[numpy.argsort(town_indexes, kind='stable')],
+                            numpy.cumsum(numpy.bincount(town_indexes))[:-1])
+
+    data = []
+    for town, ages in zip(town_names, town_ages):
+        data.append(get_percentiles_row(town, *numpy.percentile(ages, (50, 75, 99))))
+
+    return data
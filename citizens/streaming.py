@@ -0,0 +1,197 @@
+import codecs
+import hashlib
+import json
+import tempfile
+from json import JSONDecodeError
+
+CHUNK_SIZE = 64 * 1024
+# length of the longest JSON token (-Infinity) whose decoding error is reported at its start if it is cut
+MAX_TOKEN_SIZE = 9
+NUMBER_CHARS = '0123456789.eE+-'
+
+
+class JsonStreamReader:
+    """
+    Incremental reader of JSON values from a binary stream.
+
+    Only the unread part of the current chunk and the value being decoded are kept in memory.
+    """
+    whitespace = ' \t\n\r'
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def read_chunk(self, size=None):
+        """
+        Read next chunk of the stream to the buffer and drop already parsed text.
+        """
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+
+        try:
+            text = self.text_decoder.decode(chunk, final=self.eof)
+        except UnicodeDecodeError as e:
+            raise JSONDecodeError('Invalid utf-8 data', self.buffer, self.pos) from e
+
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+
+    def peek(self):
+        """
+        Skip whitespaces and return next char of the stream, empty string at the end of the stream.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.whitespace:
+                self.pos += 1
+
+            if self.pos < len(self.buffer) or self.eof:
+                break
+
+            self.read_chunk()
+
+        return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """
+        Consume next char of the stream, it must be one of chars. Return consumed char.
+        """
+        char = self.peek()
+
+        if not char or char not in chars:
+            raise JSONDecodeError('Expecting one of %r' % chars, self.buffer, self.pos)
+
+        self.pos += 1
+
+        return char
+
+    def read_value(self):
+        """
+        Decode next JSON value of the stream.
+        """
+        self.peek()
+        size = self.chunk_size
+
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except JSONDecodeError as e:
+                if self.eof or not self.is_cut(e):
+                    raise
+            else:
+                if self.eof or not self.is_cut_number(value, end):
+                    self.pos = end
+                    return value
+
+            self.read_chunk(size)
+            size *= 2
+
+    def is_cut(self, error):
+        """
+        Check if the decoding error may be caused by the value cut at the end of the buffer. Other errors are syntax
+        errors, they are raised at once instead of reading the rest of the stream.
+        """
+        return error.msg.startswith('Unterminated string') or len(self.buffer) - error.pos < MAX_TOKEN_SIZE
+
+    def is_cut_number(self, value, end):
+        """
+        Check if the decoded value is a number which may continue in the next chunk, "1." at the end of the buffer is
+        decoded as 1 and "1.5e" as 1.5.
+        """
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and all(char in NUMBER_CHARS for char in self.buffer[end:]))
+
+    def read_end(self):
+        """
+        Check that nothing except whitespaces is left in the stream.
+        """
+        if self.peek():
+            raise JSONDecodeError('Extra data', self.buffer, self.pos)
+
+
+def read_json(stream, chunk_size=CHUNK_SIZE):
+    """
+    Decode the stream which contains one JSON value.
+    """
+    reader = JsonStreamReader(stream, chunk_size)
+    value = reader.read_value()
+    reader.read_end()
+
+    return value
+
+
+def spool_payload(stream, max_size, chunk_size=CHUNK_SIZE):
+    """
+    Copy the stream to a temporary file which is kept in memory till max_size bytes.
+    :return: temporary file at its start and sha256 hex digest of the stream
+    """
+    payload = tempfile.SpooledTemporaryFile(max_size=max_size)
+    payload_hash = hashlib.sha256()
+
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        payload_hash.update(chunk)
+        payload.write(chunk)
+
+    payload.seek(0)
+
+    return payload, payload_hash.hexdigest()
+
+
+def iter_import_citizens(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield citizens of the import one by one from the stream with {"citizens": [...]} JSON object.
+    """
+    reader = JsonStreamReader(stream, chunk_size)
+    citizens_found = False
+
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.read_value()
+            if not isinstance(key, str):
+                raise JSONDecodeError('Expecting property name', reader.buffer, reader.pos)
+
+            reader.expect(':')
+
+            if key == 'citizens':
+                if citizens_found:
+                    raise JSONDecodeError('Duplicated citizens key', reader.buffer, reader.pos)
+
+                citizens_found = True
+                yield from iter_array(reader)
+            else:
+                reader.read_value()
+
+            if reader.expect(',}') == '}':
+                break
+
+    reader.read_end()
+
+    if not citizens_found:
+        raise JSONDecodeError('Expecting citizens key', reader.buffer, reader.pos)
+
+
+def iter_array(reader):
+    """
+    Yield items of JSON array one by one.
+    """
+    reader.expect('[')
+
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+
+    while True:
+        yield reader.read_value()
+
+        if reader.expect(',]') == ']':
+            break
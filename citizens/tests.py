@@ -1,11 +1,37 @@
+import gzip
+import io
 import json
 import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from json import JSONDecodeError
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+import numpy
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from backend_school import settings
-from citizens.models import Citizens, Relatives, Imports
+from benchmarks.generator import generate_citizens
+from citizens.cache import response_cache, ResponseCache
+from citizens.jobs import claim_job
+from citizens.metrics import registry
+from citizens.models import Citizens, Relatives, Imports, BirthdayPresents, ImportJobs
+from citizens.parallel import get_pool, iter_valid_citizens, pools
+from citizens.partitions import PARTITIONED_MODELS, get_partition_name, partitioning, partitioning_enabled
+from citizens.serializers import BACKENDS, dumps, citizen_rows
+from citizens.stats import count_age_percentiles, count_database_age_percentiles
+from citizens.streaming import iter_import_citizens, read_json
+from citizens.updates import CitizensUpdater
+from citizens.views import EncodedJsonStreamingResponse
 
 
 class ImportsTest(TestCase):
@@ -82,9 +108,162 @@ class ImportsTest(TestCase):
 
         self.assertEqual(len(relatives), 5)
 
+    @override_settings(CITIZENS_IMPORT_BATCH_SIZE=2)
+    def test_batched_import(self):
+        response = self.imports_post('test_right_data.json')
+        self.assertEqual(response.status_code, 201)
+
+        import_id = json.loads(response.content)['data']['import_id']
+        citizens = json.loads(self.get_data_from_file('test_right_data.json'))['citizens']
+
+        self.assertEqual(Citizens.objects.filter(import_id=import_id).count(), len(citizens))
+
+        relative_pairs = set()
+        for relative in Relatives.objects.filter(import_id=import_id).select_related('citizen_1_id', 'citizen_2_id'):
+            relative_pairs.add(frozenset((relative.citizen_1_id.citizen_id, relative.citizen_2_id.citizen_id)))
+
+        expected_pairs = set()
+        for citizen in citizens:
+            for relative in citizen['relatives']:
+                expected_pairs.add(frozenset((citizen['citizen_id'], relative)))
+
+        self.assertEqual(relative_pairs, expected_pairs)
+
+    @override_settings(CITIZENS_VALIDATION_PROCESSES=2, CITIZENS_VALIDATION_CHUNK_SIZE=2)
+    def test_parallel_validation(self):
+        self.test_wrong_data()
+        self.test_right_data()
+
+    @override_settings(CITIZENS_VALIDATION_PROCESSES=2, CITIZENS_VALIDATION_CHUNK_SIZE=2)
+    def test_broken_pool(self):
+        pool = get_pool(2)
+
+        # a process of the pool dies, the pool can not run new tasks anymore
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        self.test_right_data()
+        self.assertNotIn(2, pools)
+
+        citizens = json.loads(self.get_data_from_file('test_right_data.json'))['citizens']
+        self.assertEqual(list(iter_valid_citizens(citizens)), citizens)
+        self.assertIsNot(pools[2], pool)
+
+    def test_apostrophe(self):
+        data = json.loads(self.get_data_from_file('test_right_data.json'))
+        data['citizens'][0]['name'] = "О'Нил Иван"
+
+        response = self.client.post(reverse('citizens:imports'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        import_id = json.loads(response.content)['data']['import_id']
+        citizen = Citizens.objects.get(import_id=import_id, citizen_id=data['citizens'][0]['citizen_id'])
+        self.assertEqual(citizen.name, "О'Нил Иван")
+
+    @skipUnless(connection.vendor == 'postgresql', 'integer columns of other databases are not limited to 32 bits')
+    def test_out_of_range_integer(self):
+        data = json.loads(self.get_data_from_file('test_right_data.json'))
+        data['citizens'][0]['apartment'] = 2 ** 31
+
+        for use_copy in (True, False):
+            with self.settings(CITIZENS_IMPORT_USE_COPY=use_copy):
+                response = self.client.post(reverse('citizens:imports'), json.dumps(data),
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400, msg='use_copy=%s' % use_copy)
+
+        self.assertEqual(Imports.objects.count(), 0)
+        self.assertEqual(Citizens.objects.count(), 0)
+
+    def test_repeated_import(self):
+        response = self.imports_post('test_right_data.json')
+        import_id = json.loads(response.content)['data']['import_id']
+
+        with self.assertNumQueries(1):
+            repeated_response = self.imports_post('test_right_data.json')
+
+        self.assertEqual(repeated_response.status_code, 201)
+        self.assertEqual(json.loads(repeated_response.content)['data']['import_id'], import_id)
+        self.assertEqual(Imports.objects.count(), 1)
+        self.assertEqual(Citizens.objects.count(), 6)
+
+    def test_idempotency_key(self):
+        content = self.get_data_from_file('test_right_data.json')
+        data = json.loads(content)
+        data['citizens'][0]['name'] = 'Иванов Петр Иванович'
+        other_content = json.dumps(data)
+
+        response = self.client.post(reverse('citizens:imports'), content, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        import_id = json.loads(response.content)['data']['import_id']
+
+        repeated_response = self.client.post(reverse('citizens:imports'), content, content_type='application/json',
+                                             HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(json.loads(repeated_response.content)['data']['import_id'], import_id)
+
+        response = self.client.post(reverse('citizens:imports'), other_content, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 422)
+
+        response = self.client.post(reverse('citizens:imports'), other_content, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='key-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(json.loads(response.content)['data']['import_id'], import_id)
+        self.assertEqual(Imports.objects.count(), 2)
+
+
+class JsonStreamReaderTest(TestCase):
+    def test_citizens_stream(self):
+        content = ImportsTest.get_data_from_file('test_right_data.json').encode('utf-8')
+        citizens = json.loads(content)['citizens']
+
+        for chunk_size in (1, 7, 4096):
+            reader_citizens = list(iter_import_citizens(io.BytesIO(content), chunk_size=chunk_size))
+            self.assertEqual(reader_citizens, citizens, msg=chunk_size)
+
+    def test_other_keys(self):
+        content = b'{"version": 12345, "citizens": [{"a": 1}, {"b": [2]}], "extra": {"c": null}}'
+        self.assertEqual(list(iter_import_citizens(io.BytesIO(content), chunk_size=3)), [{'a': 1}, {'b': [2]}])
+
+    def test_cut_numbers(self):
+        content = b'{"citizens": [], "version": 1.5, "sizes": [-2.25e+3, 10, 0.125E-2]}'
+
+        for chunk_size in range(1, len(content) + 1):
+            self.assertEqual(list(iter_import_citizens(io.BytesIO(content), chunk_size=chunk_size)), [],
+                             msg=chunk_size)
+            self.assertEqual(read_json(io.BytesIO(content), chunk_size=chunk_size), json.loads(content),
+                             msg=chunk_size)
+
+    def test_wrong_stream(self):
+        wrong_contents = (b'', b'[]', b'{}', b'{"citizens": {}}', b'{"citizens": [1, 2}', b'{"citizens": []} []',
+                          b'{"citizens": [], "citizens": []}', b"{'citizens': []}")
+
+        for content in wrong_contents:
+            with self.assertRaises(JSONDecodeError, msg=content):
+                list(iter_import_citizens(io.BytesIO(content), chunk_size=2))
+
+    def test_syntax_error(self):
+        content = b'{"citizens": [{"citizen_id": x, "name": "' + b'a' * 1024 * 1024 + b'"}]}'
+        stream = io.BytesIO(content)
+
+        with self.assertRaises(JSONDecodeError):
+            list(iter_import_citizens(stream, chunk_size=1024))
+
+        self.assertLessEqual(stream.tell(), 2048)
+
+    def test_read_json(self):
+        content = ' {"name": "Иванов", "relatives": [1, 2]} '.encode('utf-8')
+
+        for chunk_size in (1, 4096):
+            self.assertEqual(read_json(io.BytesIO(content), chunk_size=chunk_size), json.loads(content))
+
+        with self.assertRaises(JSONDecodeError):
+            read_json(io.BytesIO(b'{"name": 1} 2'))
+
 
 class ChangeCitizensTest(TestCase):
     def setUp(self):
+        response_cache.clear()
+
         response = self.client.post(reverse('citizens:imports'),
                                     ImportsTest.get_data_from_file('test_right_data.json'),
                                     content_type='application/json')
@@ -95,7 +274,7 @@ class ChangeCitizensTest(TestCase):
     def test_fields(self):
         response = self.client.patch(
             reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
-            {'town': 'Керчь', 'apartment': 19}
+            {'town': 'Керчь', 'apartment': 19}, content_type='application/json'
         )
 
         content = json.loads(response.content)
@@ -119,13 +298,14 @@ class ChangeCitizensTest(TestCase):
         self.assertEqual(citizen_instance.town, 'Керчь')
         self.assertEqual(citizen_instance.apartment, 19)
         self.assertEqual(citizen_instance.name, 'Иванов Иван Иванович')
+        self.assertEqual(citizen_instance.birth_date, date(1986, 12, 26))
 
     def test_relatives(self):
         new_relatives = [3, 4]
 
         response = self.client.patch(
             reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
-            {'relatives': new_relatives}
+            {'relatives': new_relatives}, content_type='application/json'
         )
 
         content = json.loads(response.content)
@@ -148,9 +328,151 @@ class ChangeCitizensTest(TestCase):
 
             self.assertIn(relative_id.citizen_id, new_relatives)
 
+    def test_wrong_relatives(self):
+        relatives_before = list(Relatives.objects.filter(import_id=self.import_id).values())
+
+        for relatives in ([3, 100], [2, 3], [3, 3]):
+            response = self.client.patch(
+                reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
+                {'relatives': relatives, 'town': 'Керчь'}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, msg=relatives)
+
+        self.assertEqual(list(Relatives.objects.filter(import_id=self.import_id).values()), relatives_before)
+        self.assertEqual(Citizens.objects.get(import_id=self.import_id, citizen_id=2).town, 'Москва')
+
+    def test_mutual_relatives(self):
+        response = self.client.patch(
+            reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
+            {'relatives': [1, 3]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+        relatives = {citizen['citizen_id']: sorted(citizen['relatives'])
+                     for citizen in json.loads(response.content)['data']}
+
+        self.assertEqual(relatives, {1: [2, 4, 6], 2: [1, 3], 3: [2], 4: [1], 5: [], 6: [1]})
+
+    def get_citizens(self):
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+
+        return {citizen['citizen_id']: dict(citizen, relatives=sorted(citizen['relatives']))
+                for citizen in json.loads(response.content)['data']}
+
+    def test_batch_changes(self):
+        changes = [
+            {'citizen_id': 2, 'town': 'Керчь', 'relatives': [1, 3]},
+            {'citizen_id': 1, 'relatives': [2, 4, 6]},
+            {'citizen_id': 5, 'name': 'Иванов Петр Иванович', 'birth_date': '01.02.2000'},
+        ]
+
+        response = self.client.patch(reverse('citizens:list', kwargs={'import_id': self.import_id}),
+                                     {'citizens': changes}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        citizens = self.get_citizens()
+        data = json.loads(response.content)['data']
+        self.assertEqual([citizen['citizen_id'] for citizen in data], [2, 1, 5])
+
+        for citizen in data:
+            self.assertEqual(dict(citizen, relatives=sorted(citizen['relatives'])), citizens[citizen['citizen_id']])
+
+        self.assertEqual({citizen_id: citizen['relatives'] for citizen_id, citizen in citizens.items()},
+                         {1: [2, 4, 6], 2: [1, 3], 3: [2], 4: [1], 5: [], 6: [1]})
+        self.assertEqual(citizens[2]['town'], 'Керчь')
+        self.assertEqual(citizens[5]['birth_date'], '01.02.2000')
+
+    def test_wrong_batch_changes(self):
+        citizens = self.get_citizens()
+
+        wrong_changes = (
+            [{'citizen_id': 2, 'relatives': [1]}, {'citizen_id': 1, 'relatives': [4, 6]}],
+            [{'citizen_id': 2, 'town': 'Керчь'}, {'citizen_id': 2, 'name': 'Иванов'}],
+            [{'citizen_id': 2, 'town': 'Керчь'}, {'citizen_id': 10, 'town': 'Керчь'}],
+            [{'citizen_id': 2, 'town': 'Керчь'}, {'town': 'Керчь'}],
+            [{'citizen_id': 2, 'password': '123'}],
+            [],
+        )
+
+        for changes in wrong_changes:
+            response = self.client.patch(reverse('citizens:list', kwargs={'import_id': self.import_id}),
+                                         {'citizens': changes}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, msg=changes)
+
+        self.assertEqual(self.get_citizens(), citizens)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite does not run concurrent write transactions')
+class ConcurrentChangesTest(TransactionTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+        response = self.client.post(reverse('citizens:imports'),
+                                    ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+
+        content = json.loads(response.content)
+        self.import_id = content['data']['import_id']
+
+    def test_concurrent_relatives(self):
+        updated = threading.Event()
+        release = threading.Event()
+        responses = []
+
+        def update_first():
+            try:
+                with transaction.atomic():
+                    CitizensUpdater(self.import_id).update({3: {'relatives': [2, 5]}})
+                    updated.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def update_second():
+            try:
+                responses.append(self.client.patch(reverse('citizens:list', kwargs={'import_id': self.import_id}),
+                                                   {'citizens': [{'citizen_id': 5, 'relatives': [2, 3]}]},
+                                                   content_type='application/json'))
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=update_first)
+        first.start()
+        updated.wait(5)
+
+        second = threading.Thread(target=update_second)
+        second.start()
+
+        # the second update waits for the first one to commit
+        with connection.cursor() as cursor:
+            for _ in range(50):
+                cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")
+                if cursor.fetchone()[0]:
+                    break
+                time.sleep(0.1)
+            else:
+                self.fail('the second update does not wait for the first one')
+
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(responses[0].status_code, 200)
+
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+        relatives = {citizen['citizen_id']: sorted(citizen['relatives'])
+                     for citizen in json.loads(response.content)['data']}
+        self.assertEqual(relatives[3], [2, 5])
+        self.assertEqual(relatives[5], [2, 3])
+
+        self.assertEqual(CitizensBirthDayStat.get_birthdays(self), CitizensBirthDayStat.count_birthdays(self))
+
 
 class CitizensListTest(TestCase):
     def setUp(self):
+        response_cache.clear()
+
         response = self.client.post(
             reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
             content_type='application/json'
@@ -176,9 +498,107 @@ class CitizensListTest(TestCase):
         self.assertIsInstance(data, (list, tuple))
         self.assertEqual(len(data), 6)
 
+    def test_relatives(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+
+        data = json.loads(response.content)['data']
+        expected = json.loads(ImportsTest.get_data_from_file('test_right_data.json'))['citizens']
+
+        relatives = {citizen['citizen_id']: sorted(citizen['relatives']) for citizen in data}
+        expected_relatives = {citizen['citizen_id']: sorted(citizen['relatives']) for citizen in expected}
+        self.assertEqual(relatives, expected_relatives)
+
+    def test_pages(self):
+        url = reverse('citizens:list', kwargs={'import_id': self.import_id})
+        response = self.client.get(url)
+        expected = sorted(json.loads(response.content)['data'], key=lambda citizen: citizen['citizen_id'])
+
+        data = []
+        after = None
+        while True:
+            query = {'limit': 4} if after is None else {'limit': 4, 'after': after}
+            page = json.loads(self.client.get(url, query).content)
+
+            data.extend(dict(citizen, relatives=sorted(citizen['relatives'])) for citizen in page['data'])
+            after = page['next_after']
+
+            if after is None:
+                break
+
+        self.assertEqual(data, [dict(citizen, relatives=sorted(citizen['relatives'])) for citizen in expected])
+
+        response = self.client.get(url, {'after': 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'data': [], 'next_after': None})
+
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id + 1}), {'limit': 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_fields(self):
+        url = reverse('citizens:list', kwargs={'import_id': self.import_id})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'town,citizen_id'})
+
+        data = json.loads(response.content)['data']
+        self.assertEqual(len(data), 6)
+        self.assertEqual(set(data[0]), {'citizen_id', 'town'})
+
+        response = self.client.get(url, {'fields': 'name,relatives', 'limit': 2, 'after': 1})
+        content = json.loads(response.content)
+        data = [dict(citizen, relatives=sorted(citizen['relatives'])) for citizen in content['data']]
+        self.assertEqual(data, [{'name': 'Иванов Иван Иванович', 'relatives': [3, 4, 5]},
+                                {'name': 'Романова Мария Леонидовна', 'relatives': [2]}])
+        self.assertEqual(content['next_after'], 3)
+
+    def test_wrong_parameters(self):
+        url = reverse('citizens:list', kwargs={'import_id': self.import_id})
+
+        for query in ({'limit': 0}, {'limit': 'a'}, {'after': 'a'}, {'limit': settings.CITIZENS_LIST_MAX_LIMIT + 1},
+                      {'fields': 'town,password'}, {'fields': ''}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 400)
+
+    def test_streaming(self):
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+        self.assertFalse(response.streaming)
+
+        for threshold in (1, 6):
+            response_cache.clear()
+
+            with self.settings(CITIZENS_LIST_STREAMING_THRESHOLD=threshold):
+                streaming_response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+
+            self.assertEqual(streaming_response.status_code, 200)
+            self.assertTrue(streaming_response.streaming)
+            self.assertEqual(json.loads(b''.join(streaming_response.streaming_content)), json.loads(response.content))
+
+        # relatives are loaded for every streamed chunk of citizens, not for the whole import at once
+        with self.settings(CITIZENS_LIST_STREAMING_THRESHOLD=2):
+            response_cache.clear()
+            streaming_response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+
+            with self.assertNumQueries(3):
+                content = b''.join(streaming_response.streaming_content)
+
+        self.assertEqual(json.loads(content), json.loads(response.content))
+
+        contents = (
+            ([], b'{"data": []}'),
+            ([1, 2, 3, 4], b'{"data": [1, 2, 3, 4]}'),
+            (['ё'], '{"data": ["ё"]}'.encode('utf-8')),
+        )
+
+        for items, content in contents:
+            response = EncodedJsonStreamingResponse(items, chunk_size=2)
+            self.assertEqual(b''.join(response.streaming_content), content)
+
 
 class CitizensBirthDayStat(TestCase):
     def setUp(self):
+        response_cache.clear()
+
         response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
                                     content_type='application/json')
 
@@ -216,3 +636,542 @@ class CitizensBirthDayStat(TestCase):
 
         self.assertEqual(len(november_presents), 4)
         self.assertEqual(len(december_presents), 3)
+
+    def get_birthdays(self):
+        """
+        Get birthdays stat as dict of presents by citizen_id for every month.
+        """
+        response = self.client.get(reverse('citizens:birthdays', kwargs={'import_id': self.import_id}))
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.content)['data']
+
+        return {month: {present['citizen_id']: present['presents'] for present in presents}
+                for month, presents in data.items()}
+
+    def count_birthdays(self):
+        """
+        Count birthdays stat from the citizens list.
+        """
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': self.import_id}))
+        citizens = json.loads(response.content)['data']
+
+        birthdays = {str(month): {} for month in range(1, 13)}
+        for citizen in citizens:
+            presents = birthdays[str(int(citizen['birth_date'][3:5]))]
+
+            for relative in citizen['relatives']:
+                presents[relative] = presents.get(relative, 0) + 1
+
+        return birthdays
+
+    def test_changed_birthdays(self):
+        changes = (
+            (2, {'birth_date': '10.04.1986'}),
+            (2, {'relatives': [1, 3]}),
+            (1, {'birth_date': '01.12.1990', 'relatives': [2, 5, 6]}),
+            (4, {'relatives': []}),
+        )
+
+        for citizen_id, change in changes:
+            response = self.client.patch(
+                reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': citizen_id}),
+                change, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get_birthdays(), self.count_birthdays(), msg=change)
+
+    def test_presents_queries(self):
+        self.get_birthdays()
+        response_cache.clear()
+
+        # import version, citizens and presents
+        with self.assertNumQueries(3):
+            self.get_birthdays()
+
+
+class CitizensTownsStatTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+
+        content = json.loads(response.content)
+        self.import_id = content['data']['import_id']
+
+    def get_percentiles(self):
+        response = self.client.get(reverse('citizens:towns_stat_percentile_age', kwargs={'import_id': self.import_id}))
+        self.assertEqual(response.status_code, 200)
+
+        return json.loads(response.content)['data']
+
+    def count_percentiles(self):
+        """
+        Count percentiles of the import with the plain numpy percentile calls.
+        """
+        today = timezone.now().date()
+        ages = defaultdict(list)
+
+        for citizen in Citizens.objects.filter(import_id=self.import_id):
+            ages[citizen.town].append((today - citizen.birth_date).days / 365.25)
+
+        data = []
+        for town in sorted(ages):
+            data.append({'town': town, 'p50': round(numpy.percentile(ages[town], 50), 2),
+                         'p75': round(numpy.percentile(ages[town], 75), 2),
+                         'p99': round(numpy.percentile(ages[town], 99), 2)})
+
+        return data
+
+    def test_wrong_import(self):
+        response = self.client.get(
+            reverse('citizens:towns_stat_percentile_age', kwargs={'import_id': self.import_id + 1})
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_percentiles(self):
+        self.assertEqual(self.get_percentiles(), self.count_percentiles())
+
+    def test_changed_percentiles(self):
+        self.get_percentiles()
+
+        response = self.client.patch(
+            reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
+            {'town': 'Керчь', 'birth_date': '01.01.1950'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_percentiles(), self.count_percentiles())
+
+    def test_changed_by_other_worker(self):
+        self.get_percentiles()
+
+        # another worker changes the import, caches of this process are not invalidated
+        Citizens.objects.filter(import_id=self.import_id, citizen_id=2).update(town='Керчь')
+        Imports.objects.filter(pk=self.import_id).update(version=F('version') + 1)
+
+        self.assertEqual(self.get_percentiles(), self.count_percentiles())
+
+        Imports.objects.filter(pk=self.import_id).delete()
+
+        response = self.client.get(reverse('citizens:towns_stat_percentile_age', kwargs={'import_id': self.import_id}))
+        self.assertEqual(response.status_code, 404)
+
+    @skipUnless(connection.vendor == 'postgresql', 'percentile_cont is counted only by PostgreSQL')
+    @override_settings(CITIZENS_AGE_PERCENTILES_BACKEND='database')
+    def test_percentile_cont(self):
+        with mock.patch('citizens.stats.count_database_age_percentiles',
+                        wraps=count_database_age_percentiles) as database_percentiles:
+            self.test_wrong_import()
+            self.test_changed_percentiles()
+
+        # the wrong import and the import before and after the change
+        self.assertEqual(database_percentiles.call_count, 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'percentile_cont is counted only by PostgreSQL')
+    def test_percentile_cont_generated(self):
+        response = self.client.post(reverse('citizens:imports'), generate_citizens(3000, towns_count=7, seed=1),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        import_id = json.loads(response.content)['data']['import_id']
+        today = timezone.now().date()
+        birth_dates, towns = zip(*Citizens.objects.filter(import_id=import_id).values_list('birth_date', 'town'))
+
+        self.assertEqual(count_database_age_percentiles(import_id, today),
+                         count_age_percentiles(list(birth_dates), list(towns), today))
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+
+        content = json.loads(response.content)
+        self.import_id = content['data']['import_id']
+
+    def test_cached_responses(self):
+        for name in ('citizens:list', 'citizens:birthdays', 'citizens:towns_stat_percentile_age'):
+            url = reverse(name, kwargs={'import_id': self.import_id})
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('ETag', response)
+
+            with self.assertNumQueries(1):
+                cached_response = self.client.get(url)
+
+            self.assertEqual(cached_response.content, response.content)
+            self.assertEqual(cached_response['ETag'], response['ETag'])
+
+            not_modified_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified_response.status_code, 304)
+
+    def test_changed_import(self):
+        url = reverse('citizens:list', kwargs={'import_id': self.import_id})
+        response = self.client.get(url)
+
+        self.client.patch(reverse('citizens:change_imports', kwargs={'import_id': self.import_id, 'citizen_id': 2}),
+                          {'town': 'Керчь'}, content_type='application/json')
+
+        changed_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed_response.status_code, 200)
+        self.assertNotEqual(changed_response['ETag'], response['ETag'])
+
+        towns = {citizen['citizen_id']: citizen['town'] for citizen in json.loads(changed_response.content)['data']}
+        self.assertEqual(towns[2], 'Керчь')
+
+    @override_settings(CITIZENS_COMPRESSION_MIN_SIZE=0)
+    def test_compression(self):
+        url = reverse('citizens:list', kwargs={'import_id': self.import_id})
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        for _ in range(2):
+            gzip_response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+            self.assertEqual(gzip_response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip_response['Vary'], 'Accept-Encoding')
+            self.assertEqual(gzip_response['ETag'], 'W/' + response['ETag'])
+            self.assertEqual(gzip.decompress(gzip_response.content), response.content)
+
+        self.assertIn((url, response['ETag'], 'gzip'), response_cache.entries)
+
+        not_modified_response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                                HTTP_IF_NONE_MATCH=gzip_response['ETag'])
+        self.assertEqual(not_modified_response.status_code, 304)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        with self.settings(CITIZENS_LIST_STREAMING_THRESHOLD=1):
+            response_cache.clear()
+            streaming_response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertTrue(streaming_response.streaming)
+        self.assertEqual(streaming_response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(b''.join(streaming_response.streaming_content))),
+                         json.loads(response.content))
+
+    def test_lru(self):
+        lru_cache = ResponseCache(10)
+
+        lru_cache.set('a', b'1234', 'application/json')
+        lru_cache.set('b', b'1234', 'application/json')
+        lru_cache.get('a')
+        lru_cache.set('c', b'1234', 'application/json')
+
+        self.assertIsNotNone(lru_cache.get('a'))
+        self.assertIsNone(lru_cache.get('b'))
+        self.assertIsNotNone(lru_cache.get('c'))
+        self.assertEqual(lru_cache.size, 8)
+
+        lru_cache.set('d', b'12345678901', 'application/json')
+        self.assertIsNone(lru_cache.get('d'))
+
+        lru_cache.set('e', b'1234', 'application/json', expires=0)
+        self.assertIsNone(lru_cache.get('e'))
+
+
+class ImportJobsTest(TestCase):
+    def post_async(self, test_filename):
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file(test_filename),
+                                    content_type='application/json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202)
+
+        return json.loads(response.content)['data']['job_id']
+
+    def get_job(self, job_id):
+        response = self.client.get(reverse('citizens:import_job', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, 200)
+
+        return json.loads(response.content)['data']
+
+    def test_right_data(self):
+        job_id = self.post_async('test_right_data.json')
+
+        self.assertEqual(self.get_job(job_id)['status'], 'pending')
+        self.assertEqual(Imports.objects.count(), 0)
+
+        call_command('import_worker', once=True, stdout=io.StringIO())
+
+        job = self.get_job(job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['citizens_count'], 6)
+        self.assertEqual(Citizens.objects.filter(import_id=job['import_id']).count(), 6)
+        self.assertEqual(Relatives.objects.filter(import_id=job['import_id']).count(), 5)
+
+    def test_validated_once(self):
+        self.post_async('test_right_data.json')
+
+        with mock.patch('citizens.views.iter_valid_citizens', wraps=iter_valid_citizens) as views_validation, \
+                mock.patch('citizens.jobs.iter_valid_citizens', wraps=iter_valid_citizens) as jobs_validation:
+            call_command('import_worker', once=True, stdout=io.StringIO())
+
+        self.assertEqual(jobs_validation.call_count, 1)
+        self.assertEqual(views_validation.call_count, 0)
+
+    def test_wrong_data(self):
+        job_id = self.post_async('wrong_data/test_relatives_unknown.json')
+
+        call_command('import_worker', once=True, stdout=io.StringIO())
+
+        job = self.get_job(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIsNone(job['import_id'])
+        self.assertEqual(Imports.objects.count(), 0)
+
+    def test_repeated_job(self):
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+        import_id = json.loads(response.content)['data']['import_id']
+
+        job_id = self.post_async('test_right_data.json')
+        call_command('import_worker', once=True, stdout=io.StringIO())
+
+        job = self.get_job(job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['import_id'], import_id)
+        self.assertEqual(job['citizens_count'], 6)
+        self.assertEqual(Imports.objects.count(), 1)
+
+    def test_idempotency_key(self):
+        content = ImportsTest.get_data_from_file('test_right_data.json')
+        other_content = content.replace('Иванов Иван Иванович', 'Иванов Петр Иванович')
+
+        def post(content, key):
+            return self.client.post(reverse('citizens:imports'), content, content_type='application/json',
+                                    HTTP_PREFER='respond-async', HTTP_IDEMPOTENCY_KEY=key)
+
+        response = post(content, 'key-1')
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.content)['data']['job_id']
+
+        repeated_response = post(content, 'key-1')
+        self.assertEqual(repeated_response.status_code, 202)
+        self.assertEqual(json.loads(repeated_response.content)['data']['job_id'], job_id)
+        self.assertEqual(post(other_content, 'key-1').status_code, 422)
+        self.assertEqual(ImportJobs.objects.count(), 1)
+
+        call_command('import_worker', once=True, stdout=io.StringIO())
+        import_id = self.get_job(job_id)['import_id']
+        self.assertEqual(Imports.objects.get(pk=import_id).idempotency_key, 'key-1')
+
+        # the key of a synchronous import is found too
+        response = self.client.post(reverse('citizens:imports'), other_content, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='key-2')
+        other_import_id = json.loads(response.content)['data']['import_id']
+
+        response = post(other_content, 'key-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)['data']['import_id'], other_import_id)
+        self.assertEqual(post(content, 'key-2').status_code, 422)
+        self.assertEqual(ImportJobs.objects.count(), 1)
+
+    def test_unexpected_error(self):
+        job_id = self.post_async('test_right_data.json')
+        other_job_id = self.post_async('wrong_data/test_relatives_unknown.json')
+        stderr = io.StringIO()
+
+        with mock.patch('citizens.jobs.validate_payload', side_effect=RuntimeError('worker bug')):
+            call_command('import_worker', once=True, stdout=io.StringIO(), stderr=stderr)
+
+        self.assertIn('RuntimeError: worker bug', stderr.getvalue())
+
+        for job_id in (job_id, other_job_id):
+            job = self.get_job(job_id)
+            self.assertEqual(job['status'], 'failed')
+            self.assertIsNone(job['import_id'])
+
+        self.assertEqual(Imports.objects.count(), 0)
+
+    def test_abandoned_job(self):
+        job_id = self.post_async('test_right_data.json')
+
+        # the worker which claimed the job was killed
+        self.assertEqual(claim_job().id, job_id)
+        call_command('import_worker', once=True, stdout=io.StringIO())
+        self.assertEqual(self.get_job(job_id)['status'], 'validating')
+
+        started_at = timezone.now() - timedelta(seconds=settings.CITIZENS_IMPORT_JOB_TIMEOUT + 1)
+        ImportJobs.objects.filter(pk=job_id).update(started_at=started_at)
+        call_command('import_worker', once=True, stdout=io.StringIO())
+
+        job = self.get_job(job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(Citizens.objects.filter(import_id=job['import_id']).count(), 6)
+
+    def test_attempts(self):
+        job_id = self.post_async('test_right_data.json')
+        ImportJobs.objects.filter(pk=job_id).update(status='writing', started_at=timezone.now() - timedelta(days=1),
+                                                    attempts=settings.CITIZENS_IMPORT_JOB_MAX_ATTEMPTS)
+
+        call_command('import_worker', once=True, stdout=io.StringIO())
+
+        self.assertEqual(self.get_job(job_id)['status'], 'failed')
+        self.assertEqual(Imports.objects.count(), 0)
+
+    def test_wrong_job(self):
+        response = self.client.get(reverse('citizens:import_job', kwargs={'job_id': 1}))
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'tables are partitioned only on PostgreSQL')
+class PartitionsTest(TestCase):
+    def test_partitions(self):
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+        import_id = json.loads(response.content)['data']['import_id']
+
+        if connection.pg_version < 110000:
+            self.assertFalse(partitioning_enabled())
+            return
+
+        self.assertTrue(partitioning_enabled())
+
+        with connection.cursor() as cursor:
+            for model in PARTITIONED_MODELS:
+                cursor.execute('SELECT count(*) FROM %s' % get_partition_name(model, import_id))
+                self.assertEqual(cursor.fetchone()[0], model.objects.filter(import_id=import_id).count())
+
+    def test_failed_import(self):
+        if not partitioning_enabled():
+            return
+
+        with connection.cursor() as cursor:
+            for test_file in ImportsTest.get_wrong_files_list():
+                response = self.client.post(reverse('citizens:imports'),
+                                            ImportsTest.get_data_from_file('wrong_data/%s' % test_file),
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400, msg=test_file)
+
+                # partitions of the failed import are dropped
+                cursor.execute('SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass(%s)',
+                               [Citizens._meta.db_table])
+                self.assertEqual(cursor.fetchone()[0], 0, msg=test_file)
+
+    def test_old_postgresql(self):
+        with mock.patch.dict(connection.__dict__, {'pg_version': 90600}), mock.patch.dict(partitioning, clear=True):
+            with self.assertNumQueries(0):
+                self.assertFalse(partitioning_enabled())
+
+
+class DeleteImportsTest(TestCase):
+    def post_import(self, name):
+        data = json.loads(ImportsTest.get_data_from_file('test_right_data.json'))
+        data['citizens'][0]['name'] = name
+
+        response = self.client.post(reverse('citizens:imports'), json.dumps(data), content_type='application/json')
+
+        return json.loads(response.content)['data']['import_id']
+
+    def test_delete(self):
+        import_id = self.post_import('Иванов Иван')
+        other_import_id = self.post_import('Петров Петр')
+
+        response = self.client.delete(reverse('citizens:import', kwargs={'import_id': import_id}))
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get(reverse('citizens:list', kwargs={'import_id': import_id}))
+        self.assertEqual(response.status_code, 404)
+
+        for model in (Citizens, Relatives, BirthdayPresents):
+            self.assertFalse(model.objects.filter(import_id=import_id).exists())
+            self.assertTrue(model.objects.filter(import_id=other_import_id).exists())
+
+        response = self.client.delete(reverse('citizens:import', kwargs={'import_id': import_id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_retention(self):
+        import_ids = [self.post_import(name) for name in ('Иванов Иван', 'Петров Петр', 'Сидоров Сидор')]
+        Imports.objects.filter(pk=import_ids[1]).update(created_at=timezone.now() - timedelta(days=10))
+
+        call_command('delete_imports', keep_last=2, max_age=30, stdout=io.StringIO())
+        self.assertEqual(Imports.objects.count(), 3)
+
+        call_command('delete_imports', keep_last=1, max_age=5, dry_run=True, stdout=io.StringIO())
+        self.assertEqual(Imports.objects.count(), 3)
+
+        call_command('delete_imports', keep_last=1, max_age=5, stdout=io.StringIO())
+        self.assertEqual(sorted(Imports.objects.values_list('id', flat=True)), [import_ids[0], import_ids[2]])
+
+        call_command('delete_imports', keep_last=1, stdout=io.StringIO())
+        self.assertEqual(list(Imports.objects.values_list('id', flat=True)), [import_ids[2]])
+        self.assertEqual(Citizens.objects.count(), 6)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_server_timing(self):
+        response = self.client.post(reverse('citizens:imports'), ImportsTest.get_data_from_file('test_right_data.json'),
+                                    content_type='application/json')
+
+        server_timing = response['Server-Timing']
+        self.assertIn('import;dur=', server_timing)
+        self.assertIn('db;dur=', server_timing)
+        self.assertIn('total;dur=', server_timing)
+
+    def test_metrics(self):
+        self.client.get(reverse('citizens:list', kwargs={'import_id': 1}))
+        self.client.get(reverse('citizens:list', kwargs={'import_id': 1}))
+
+        response = self.client.get(reverse('citizens:metrics'))
+        self.assertEqual(response.status_code, 200)
+
+        content = response.content.decode()
+        self.assertIn('citizens_request_duration_seconds_count{endpoint="citizens:list"} 2', content)
+        self.assertIn('citizens_request_duration_seconds_bucket{endpoint="citizens:list",le="+Inf"} 2', content)
+        self.assertIn('citizens_request_queries_total{endpoint="citizens:list"}', content)
+
+    def test_remote_metrics(self):
+        response = self.client.get(reverse('citizens:metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+
+class SerializersTest(TestCase):
+    def test_backends(self):
+        data = {'data': [{'citizen_id': 1, 'town': 'Москва', 'birth_date': date(1986, 12, 26), 'relatives': [2, 3]}]}
+
+        for backend in BACKENDS:
+            content = dumps(data, backend)
+
+            self.assertIn('Москва'.encode('utf-8'), content)
+            self.assertEqual(json.loads(content),
+                             {'data': [{'citizen_id': 1, 'town': 'Москва', 'birth_date': '1986-12-26',
+                                        'relatives': [2, 3]}]})
+
+    def test_citizen_rows(self):
+        rows = list(citizen_rows([(1, 'Москва', date(1986, 12, 6))], ('citizen_id', 'town', 'birth_date'), {1: [2]}))
+
+        self.assertEqual(rows, [{'citizen_id': 1, 'town': 'Москва', 'birth_date': '06.12.1986', 'relatives': [2]}])
+
+    def test_json_backend(self):
+        citizens = json.loads(ImportsTest.get_data_from_file('test_right_data.json'))['citizens']
+
+        for backend in BACKENDS:
+            response_cache.clear()
+            encoder = mock.Mock(wraps=BACKENDS[backend])
+            # towns differ between the backends, so the import is not deduplicated with the import of the other one
+            payload = {'citizens': [dict(citizen, town=backend) for citizen in citizens]}
+
+            with override_settings(CITIZENS_JSON_BACKEND=backend), mock.patch.dict(BACKENDS, {backend: encoder}):
+                response = self.client.post(reverse('citizens:imports'), payload, content_type='application/json')
+                self.assertEqual(response.status_code, 201)
+
+                import_id = json.loads(response.content)['data']['import_id']
+                response = self.client.get(reverse('citizens:list', kwargs={'import_id': import_id}))
+
+            self.assertEqual(encoder.call_count, 2, msg=backend)
+
+            data = json.loads(response.content)['data']
+            self.assertEqual(sorted((citizen['citizen_id'], citizen['town'], sorted(citizen['relatives']))
+                                    for citizen in data),
+                             sorted((citizen['citizen_id'], backend, sorted(citizen['relatives']))
+                                    for citizen in payload['citizens']), msg=backend)
@@ -0,0 +1,160 @@
+from collections import defaultdict
+
+from django.db.models import F, Q
+
+from citizens.models import Imports, Citizens, Relatives
+from citizens.stats import count_presents, update_presents
+from citizens.validators import InvalidImportError, parse_birth_date
+
+
+class CitizensUpdater:
+    """
+    Apply changes to citizens of one import.
+
+    Relatives are changed by the difference between the old and the new relations of the changed citizens, so only
+    the changed relatives rows are deleted or inserted. Must be used inside transaction.atomic(), the import row is
+    locked until the end of the transaction.
+    """
+
+    def __init__(self, import_id):
+        self.import_id = import_id
+        self.citizens = {}
+
+    def update(self, changes):
+        """
+        Apply changes to the citizens. Raise InvalidImportError if citizen or relative does not exist, relatives
+        list has duplicates or the citizen himself or relatives lists of the changed citizens contradict each other.
+        :param changes: dict of validated citizen changes by citizen_id
+        """
+        for citizen_id, data in changes.items():
+            if 'relatives' in data:
+                relatives = set(data['relatives'])
+
+                if len(relatives) != len(data['relatives']) or citizen_id in relatives:
+                    raise InvalidImportError
+
+        # the version is changed first, so the import row lock makes concurrent updates of the import wait for
+        # each other and relatives and presents are read after the earlier update is committed
+        if not Imports.objects.filter(pk=self.import_id).update(version=F('version') + 1):
+            raise InvalidImportError
+
+        citizens = Citizens.objects.filter(import_id=self.import_id, citizen_id__in=changes)
+        self.citizens = {citizen.citizen_id: citizen for citizen in citizens}
+
+        if len(self.citizens) != len(changes):
+            raise InvalidImportError
+
+        affected_ids = {citizen_id for citizen_id, data in changes.items()
+                        if 'relatives' in data or 'birth_date' in data}
+
+        old_pairs, citizens_info = self.get_relative_pairs(affected_ids)
+        old_months = {citizen_id: birth_date.month for citizen_id, (pk, birth_date) in citizens_info.items()}
+
+        relatives_changed = {citizen_id for citizen_id, data in changes.items() if 'relatives' in data}
+        new_pairs = {pair for pair in old_pairs if pair[0] not in relatives_changed and pair[1] not in relatives_changed}
+        for citizen_id in relatives_changed:
+            new_pairs.update((min(citizen_id, relative), max(citizen_id, relative))
+                             for relative in changes[citizen_id]['relatives'])
+
+        # relatives lists of the changed citizens must agree with each other
+        new_relatives = defaultdict(set)
+        for citizen_1, citizen_2 in new_pairs:
+            new_relatives[citizen_1].add(citizen_2)
+            new_relatives[citizen_2].add(citizen_1)
+
+        for citizen_id in relatives_changed:
+            if new_relatives[citizen_id] != set(changes[citizen_id]['relatives']):
+                raise InvalidImportError
+
+        unknown_ids = {citizen_id for pair in new_pairs for citizen_id in pair} - citizens_info.keys()
+        if unknown_ids:
+            citizens_info.update(self.get_citizens_info(unknown_ids))
+
+            if not unknown_ids <= citizens_info.keys():
+                raise InvalidImportError
+
+        self.update_fields(changes)
+
+        new_months = {citizen_id: birth_date.month for citizen_id, (pk, birth_date) in citizens_info.items()}
+        for citizen_id, citizen in self.citizens.items():
+            new_months[citizen_id] = citizen.birth_date.month
+
+        self.update_relatives(old_pairs, new_pairs, citizens_info)
+
+        presents = count_presents(new_months, new_pairs)
+        presents.subtract(count_presents(old_months, old_pairs))
+        update_presents(self.import_id, {key: count for key, count in presents.items() if count != 0})
+
+    def get_relative_pairs(self, citizen_ids):
+        """
+        Get relatives of the citizens with one query.
+        :return: dict of relatives row ids by (citizen_id, citizen_id) pairs with the smaller id first and dict of
+        (pk, birth_date) of the citizens and their relatives by citizen_id
+        """
+        citizen_pks = [self.citizens[citizen_id].id for citizen_id in citizen_ids]
+        citizens_info = {citizen_id: (self.citizens[citizen_id].id, self.citizens[citizen_id].birth_date)
+                         for citizen_id in citizen_ids}
+
+        if not citizen_pks:
+            return {}, citizens_info
+
+        relatives = Relatives.objects.filter(
+            Q(citizen_1_id__in=citizen_pks) | Q(citizen_2_id__in=citizen_pks), import_id=self.import_id,
+            citizen_1_id__import_id=self.import_id, citizen_2_id__import_id=self.import_id
+        ).values_list('id', 'citizen_1_id', 'citizen_1_id__citizen_id', 'citizen_1_id__birth_date',
+                      'citizen_2_id', 'citizen_2_id__citizen_id', 'citizen_2_id__birth_date')
+
+        relative_pairs = {}
+        for relative_pk, citizen_1_pk, citizen_1, birth_date_1, citizen_2_pk, citizen_2, birth_date_2 in relatives:
+            relative_pairs[(min(citizen_1, citizen_2), max(citizen_1, citizen_2))] = relative_pk
+            citizens_info.setdefault(citizen_1, (citizen_1_pk, birth_date_1))
+            citizens_info.setdefault(citizen_2, (citizen_2_pk, birth_date_2))
+
+        return relative_pairs, citizens_info
+
+    def get_citizens_info(self, citizen_ids):
+        """
+        Get dict of (pk, birth_date) of the import citizens by citizen_id with one IN lookup.
+        """
+        citizens = Citizens.objects.filter(import_id=self.import_id, citizen_id__in=citizen_ids).values_list(
+            'citizen_id', 'id', 'birth_date'
+        )
+
+        return {citizen_id: (pk, birth_date) for citizen_id, pk, birth_date in citizens}
+
+    def update_fields(self, changes):
+        """
+        Set changed fields of the citizens and write them with one bulk update.
+        """
+        changed_fields = set()
+
+        for citizen_id, data in changes.items():
+            citizen = self.citizens[citizen_id]
+
+            for field_name, value in data.items():
+                if field_name == 'birth_date':
+                    setattr(citizen, field_name, parse_birth_date(value))
+                elif field_name != 'relatives':
+                    setattr(citizen, field_name, value)
+
+                changed_fields.add(field_name)
+
+        changed_fields.discard('relatives')
+
+        # the import condition lets PostgreSQL update only the partition of the import
+        if changed_fields:
+            Citizens.objects.filter(import_id=self.import_id).bulk_update(self.citizens.values(), changed_fields)
+
+    def update_relatives(self, old_pairs, new_pairs, citizens_info):
+        """
+        Delete removed relatives rows and insert added ones.
+        """
+        removed_pks = [relative_pk for pair, relative_pk in old_pairs.items() if pair not in new_pairs]
+        if removed_pks:
+            Relatives.objects.filter(import_id=self.import_id, id__in=removed_pks).delete()
+
+        Relatives.objects.bulk_create(
+            Relatives(import_id_id=self.import_id, citizen_1_id_id=citizens_info[citizen_1][0],
+                      citizen_2_id_id=citizens_info[citizen_2][0])
+            for citizen_1, citizen_2 in new_pairs if (citizen_1, citizen_2) not in old_pairs
+        )
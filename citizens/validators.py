@@ -0,0 +1,228 @@
+from datetime import datetime, date
+
+BIRTH_DATE_FORMAT = '%d.%m.%Y'
+
+
+def parse_birth_date(birth_date):
+    """
+    Convert 'DD.MM.YYYY' string of API to date.
+    """
+    return datetime.strptime(birth_date, BIRTH_DATE_FORMAT).date()
+
+
+def format_birth_date(birth_date):
+    """
+    Convert date to 'DD.MM.YYYY' string of API.
+    """
+    return '%02d.%02d.%04d' % (birth_date.day, birth_date.month, birth_date.year)
+
+
+class InvalidImportError(Exception):
+    """
+    Import data does not correspond requested rules.
+    """
+
+
+class CitizenFields:
+    """
+    Check functions of citizen fields.
+    Return True if field value is right.
+    """
+
+    @staticmethod
+    def is_valid_str_alnum(string):
+        """
+        Check if string is str, has not zero length, and there is at least 1 letter or digit.
+        """
+        if not isinstance(string, str):
+            return False
+
+        if len(string) <= 0 or len(string) > 256:
+            return False
+
+        for char in string:
+            if char.isalnum():
+                return True
+
+        return False
+
+    @staticmethod
+    def is_valid_str(string):
+        if not isinstance(string, str):
+            return False
+
+        if len(string) <= 0 or len(string) > 256:
+            return False
+
+        return True
+
+    @staticmethod
+    def is_valid_int(integer):
+        if not isinstance(integer, int) or integer < 0:
+            return False
+
+        return True
+
+    @staticmethod
+    def is_valid_date(birth_date):
+        """
+        Check if date has valid format or not.
+        """
+        if not isinstance(birth_date, str):
+            return False
+
+        try:
+            date_obj = parse_birth_date(birth_date)
+        except ValueError:
+            return False
+
+        if date_obj >= date.today():
+            return False
+
+        return True
+
+    @classmethod
+    def check_citizen_id(cls, value):
+        return cls.is_valid_int(value)
+
+    @classmethod
+    def check_town(cls, value):
+        return cls.is_valid_str_alnum(value)
+
+    @classmethod
+    def check_street(cls, value):
+        return cls.is_valid_str_alnum(value)
+
+    @classmethod
+    def check_building(cls, value):
+        return cls.is_valid_str_alnum(value)
+
+    @classmethod
+    def check_apartment(cls, value):
+        return cls.is_valid_int(value)
+
+    @classmethod
+    def check_name(cls, value):
+        return cls.is_valid_str(value)
+
+    @classmethod
+    def check_birth_date(cls, value):
+        return cls.is_valid_date(value)
+
+    @classmethod
+    def check_gender(cls, value):
+        if value != 'male' and value != 'female':
+            return False
+
+        return True
+
+    @classmethod
+    def check_relatives(cls, value):
+        if not isinstance(value, (list, tuple)):
+            return False
+
+        for item in value:
+            if not cls.is_valid_int(item):
+                return False
+
+        return True
+
+
+def citizen_is_valid(citizen):
+    """
+    Check if citizen dict is valid.
+    """
+    required_fields = (
+        'citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender', 'relatives'
+    )
+
+    if not isinstance(citizen, dict):
+        return False
+
+    for field in required_fields:
+        if field not in citizen:
+            return False
+
+        check_function = getattr(CitizenFields, 'check_%s' % field)
+
+        if not check_function(citizen[field]):
+            return False
+
+    if len(citizen) != 9:
+        return False
+
+    return True
+
+
+def citizens_are_valid(citizens):
+    """
+    Check if all citizen dicts of the list are valid.
+    """
+    for citizen in citizens:
+        if not citizen_is_valid(citizen):
+            return False
+
+    return True
+
+
+class RelativesValidator:
+    """
+    Check relatives of the import citizens in one pass.
+
+    Citizens are added one by one, their relatives are kept in adjacency sets. Relatives are valid if citizen ids
+    are unique, nobody is a relative of himself, every relative is a citizen of the import and every relation is
+    mutual.
+    """
+
+    def __init__(self):
+        self.relatives = {}
+
+    def add(self, citizen_id, relatives):
+        """
+        Add citizen relatives. Return False if citizen_id is duplicated or relatives list is not valid.
+        """
+        if citizen_id in self.relatives:
+            return False
+
+        relatives_set = set(relatives)
+
+        if len(relatives_set) != len(relatives) or citizen_id in relatives_set:
+            return False
+
+        self.relatives[citizen_id] = relatives_set
+
+        return True
+
+    def is_valid(self):
+        """
+        Check if all relations are mutual and point to the citizens of the import.
+        """
+        relatives_dict = self.relatives
+
+        for citizen_id, relatives in relatives_dict.items():
+            for relative in relatives:
+                relative_relatives = relatives_dict.get(relative)
+
+                if relative_relatives is None or citizen_id not in relative_relatives:
+                    return False
+
+        return True
+
+
+def iter_valid_relatives(citizens):
+    """
+    Yield citizens while their relatives are checked, raise InvalidImportError on the first citizen with a wrong
+    relatives list. Mutual relations are checked after the last citizen, so citizens are valid only if the iteration
+    is finished.
+    :param citizens: iterable of citizen dicts checked by the field rules
+    """
+    relatives_validator = RelativesValidator()
+
+    for citizen in citizens:
+        if not relatives_validator.add(citizen['citizen_id'], citizen['relatives']):
+            raise InvalidImportError
+
+        yield citizen
+
+    if not relatives_validator.is_valid():
+        raise InvalidImportError
@@ -1,488 +1,560 @@
-import json
-from collections import Counter
-from datetime import datetime, date
+import hashlib
+from collections import defaultdict
+from itertools import islice, chain
 from json import JSONDecodeError
 
-from django.core.serializers.json import DjangoJSONEncoder
-from django.db import DataError
-from django.forms import model_to_dict
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse, HttpResponse
+from django.urls import reverse
 from django.views import View
-from numpy import percentile
 
-from citizens.models import Imports, Citizens, Relatives
-
-
-class EncodedJsonResponse(JsonResponse):
+from citizens.cache import CachedResponseMixin
+from citizens.ingestion import CitizensImporter
+from citizens.metrics import phase, registry
+from citizens.models import Imports, Citizens, Relatives, BirthdayPresents, ImportJobs
+from citizens.parallel import iter_valid_citizens
+from citizens.partitions import create_import_partitions, drop_partitions
+from citizens.retention import delete_import
+from citizens.serializers import dumps, get_dumps, citizen_rows
+from citizens.stats import get_age_percentiles
+from citizens.streaming import read_json, iter_import_citizens, spool_payload
+from citizens.updates import CitizensUpdater
+from citizens.validators import CitizenFields, InvalidImportError, format_birth_date, iter_valid_relatives
+
+
+class EncodedJsonResponse(HttpResponse):
     """
-    JsonResponse with utf8 encoding.
+    JSON response with utf8 encoding. Data is encoded with the JSON backend of CITIZENS_JSON_BACKEND setting.
     """
 
-    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
-        if json_dumps_params is None:
-            json_dumps_params = {}
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
 
-        json_dumps_params.update({'ensure_ascii': False})
-        super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
 
 
-class CitizenFields:
+class EncodedJsonStreamingResponse(StreamingHttpResponse):
     """
-    Check functions of citizen fields.
-    Return True if field value is right.
+    Streaming response with {"data": [...]} utf8 JSON object. Items are encoded while the response is sent.
     """
 
+    def __init__(self, items, chunk_size=1000, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(self.iter_content(items, get_dumps(), chunk_size), **kwargs)
+
     @staticmethod
-    def is_valid_str_alnum(string):
+    def iter_content(items, dumps_item, chunk_size):
         """
-        Check if string is str, has not zero length, and there is at least 1 letter or digit.
+        Yield encoded JSON fragments, chunk_size items per fragment.
         """
-        if not isinstance(string, str):
-            return False
+        yield b'{"data": ['
 
-        if len(string) <= 0 or len(string) > 256:
-            return False
+        separator = b''
+        chunk = []
+        for item in items:
+            chunk.append(dumps_item(item))
 
-        for char in string:
-            if char.isalnum():
-                return True
+            if len(chunk) >= chunk_size:
+                yield separator + b', '.join(chunk)
+                separator = b', '
+                chunk = []
 
-        return False
+        if chunk:
+            yield separator + b', '.join(chunk)
 
-    @staticmethod
-    def is_valid_str(string):
-        if not isinstance(string, str):
-            return False
+        yield b']}'
 
-        if len(string) <= 0 or len(string) > 256:
-            return False
 
-        return True
+class ImportsView(View):
+    def post(self, request, *args, **kwargs):
+        if 'respond-async' in request.META.get('HTTP_PREFER', ''):
+            return self.post_async(request)
+
+        idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+
+        with phase(request, 'spool'):
+            payload, payload_hash = spool_payload(request, settings.CITIZENS_IMPORT_SPOOL_SIZE)
+
+        with payload:
+            import_inst = self.get_existing_import(payload_hash, idempotency_key)
+
+            if import_inst is None:
+                try:
+                    # the payload is parsed, validated and written at once, so the phases are measured together
+                    with phase(request, 'import'):
+                        import_inst = self.import_citizens(iter_import_citizens(payload), payload_hash,
+                                                           idempotency_key)
+                except (JSONDecodeError, InvalidImportError, DataError):
+                    return EncodedJsonResponse({}, status=400)
+                except IntegrityError:
+                    # the same payload or key was imported by a concurrent request
+                    import_inst = self.get_existing_import(payload_hash, idempotency_key)
+
+                    if import_inst is None:
+                        raise
+
+        return self.get_import_response(import_inst, payload_hash)
 
     @staticmethod
-    def is_valid_int(integer):
-        if not isinstance(integer, int) or integer < 0:
-            return False
+    def get_import_response(import_inst, payload_hash):
+        """
+        Get response with the import id, 422 if the import has the idempotency key of the request, but another payload.
+        """
+        if import_inst.payload_hash != payload_hash:
+            # the idempotency key was used for another payload
+            return EncodedJsonResponse({}, status=422)
 
-        return True
+        return EncodedJsonResponse({'data': {'import_id': import_inst.id}}, status=201)
 
     @staticmethod
-    def is_valid_date(birth_date):
+    def get_existing_import(payload_hash, idempotency_key=None):
         """
-        Check if date has valid format or not.
+        Get import with the idempotency key or with the same payload or None.
         """
-        if not isinstance(birth_date, str):
-            return False
+        if idempotency_key is not None:
+            import_inst = Imports.objects.filter(idempotency_key=idempotency_key).first()
 
-        try:
-            date_obj = datetime.strptime(birth_date, '%d.%m.%Y').date()
-        except ValueError:
-            return False
+            if import_inst is not None:
+                return import_inst
 
-        if date_obj >= date.today():
-            return False
+        return Imports.objects.filter(payload_hash=payload_hash).first()
 
-        return True
+    @staticmethod
+    def get_existing_job(idempotency_key):
+        """
+        Get job with the idempotency key or None.
+        """
+        if idempotency_key is None:
+            return None
 
-    @classmethod
-    def check_citizen_id(cls, value):
-        return cls.is_valid_int(value)
+        return ImportJobs.objects.defer('payload').filter(idempotency_key=idempotency_key).first()
 
     @classmethod
-    def check_town(cls, value):
-        return cls.is_valid_str_alnum(value)
+    def post_async(cls, request):
+        """
+        Save the payload for the import worker and return the job id. Requests with the idempotency key of an earlier
+        request get its job or its import.
+        """
+        idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        payload = request.body
+        payload_hash = hashlib.sha256(payload).hexdigest()
 
-    @classmethod
-    def check_street(cls, value):
-        return cls.is_valid_str_alnum(value)
+        job = cls.get_existing_job(idempotency_key)
 
-    @classmethod
-    def check_building(cls, value):
-        return cls.is_valid_str_alnum(value)
+        if job is None and idempotency_key is not None:
+            import_inst = Imports.objects.filter(idempotency_key=idempotency_key).first()
 
-    @classmethod
-    def check_apartment(cls, value):
-        return cls.is_valid_int(value)
+            if import_inst is not None:
+                return cls.get_import_response(import_inst, payload_hash)
 
-    @classmethod
-    def check_name(cls, value):
-        return cls.is_valid_str(value)
+        if job is None:
+            try:
+                with transaction.atomic():
+                    job = ImportJobs.objects.create(payload=payload, payload_hash=payload_hash,
+                                                    idempotency_key=idempotency_key)
+            except IntegrityError:
+                # the key was used by a concurrent request
+                job = cls.get_existing_job(idempotency_key)
 
-    @classmethod
-    def check_birth_date(cls, value):
-        return cls.is_valid_date(value)
+                if job is None:
+                    raise
 
-    @classmethod
-    def check_gender(cls, value):
-        if value != 'male' and value != 'female':
-            return False
+        if job.payload_hash != payload_hash:
+            return EncodedJsonResponse({}, status=422)
 
-        return True
+        response = EncodedJsonResponse({'data': {'job_id': job.id}}, status=202)
+        response['Location'] = reverse('citizens:import_job', kwargs={'job_id': job.id})
+
+        return response
 
     @classmethod
-    def check_relatives(cls, value):
-        if not isinstance(value, (list, tuple)):
-            return False
+    def import_citizens(cls, citizens, payload_hash=None, idempotency_key=None, validate=True):
+        """
+        Validate citizens and write them to the database in one transaction.
+        Raise InvalidImportError if citizens are not valid. Citizens which were validated already are written with
+        validate=False.
+        """
+        if validate:
+            citizens = iter_valid_relatives(iter_valid_citizens(citizens))
 
-        for item in value:
-            if not cls.is_valid_int(item):
-                return False
+        import_id = create_import_partitions()
 
-        return True
+        try:
+            with transaction.atomic():
+                importer = CitizensImporter(import_id, payload_hash=payload_hash, idempotency_key=idempotency_key)
 
+                for citizen in citizens:
+                    importer.add(citizen)
 
-class ImportsView(View):
-    def post(self, request, *args, **kwargs):
+                return importer.finish()
+        except Exception:
+            # partitions were committed before the import
+            if import_id is not None:
+                drop_partitions(import_id)
+
+            raise
+
+
+class ImportView(View):
+    def delete(self, request, *args, **kwargs):
+        with phase(request, 'delete'):
+            if not delete_import(kwargs['import_id']):
+                return EncodedJsonResponse({}, status=404)
+
+        return HttpResponse(status=204)
+
+
+class ImportJobView(View):
+    def get(self, request, *args, **kwargs):
         try:
-            data = json.loads(request.body.decode('utf-8').replace('\'', '\"'))
-        except JSONDecodeError:
-            return EncodedJsonResponse({}, status=400)
+            job = ImportJobs.objects.defer('payload').get(pk=kwargs['job_id'])
+        except ImportJobs.DoesNotExist:
+            return EncodedJsonResponse({}, status=404)
 
-        if not self.is_valid(data):
-            return EncodedJsonResponse({}, status=400)
+        data = {'job_id': job.id, 'status': job.status, 'citizens_count': job.citizens_count,
+                'import_id': job.import_id_id}
 
-        import_inst = Imports()
-        import_inst.save()
+        return EncodedJsonResponse({'data': data}, status=200)
 
-        citizens = data['citizens']
-        citizens_list = {}
 
-        for citizen in citizens:
-            relatives_tmp = citizen.pop('relatives')
-            citizen_inst = Citizens(**citizen, import_id=import_inst)
+class ChangeImports(View):
+    def patch(self, request, *args, **kwargs):
+        try:
+            with phase(request, 'parse'):
+                data = read_json(request)
+        except JSONDecodeError:
+            return EncodedJsonResponse({}, status=400)
 
-            try:
-                citizen_inst.save()
-            except DataError:
-                import_inst.delete()
+        with phase(request, 'validate'):
+            if not self.is_valid_citizen(data):
                 return EncodedJsonResponse({}, status=400)
 
-            citizens_list.update({citizen['citizen_id']: citizen_inst})
-            citizen['relatives'] = relatives_tmp
+        import_id = kwargs['import_id']
+        citizen_id = kwargs['citizen_id']
 
-        relative_pairs = self.get_relative_pairs(citizens, citizens_list)
+        try:
+            with phase(request, 'update'), transaction.atomic():
+                updater = CitizensUpdater(import_id)
+                updater.update({citizen_id: data})
+        except (InvalidImportError, DataError):
+            return EncodedJsonResponse({}, status=400)
 
-        relative_instances = []
-        for relative_pair in relative_pairs:
-            relative_instances.append(
-                Relatives(citizen_1_id=relative_pair[0], citizen_2_id=relative_pair[1], import_id=import_inst)
-            )
+        citizen = updater.citizens[citizen_id]
 
-        Relatives.objects.bulk_create(relative_instances)
+        response_content = {field: getattr(citizen, field) for field in CitizensList.citizen_fields}
+        response_content['birth_date'] = format_birth_date(citizen.birth_date)
+        if 'relatives' in data:
+            response_content.update({'relatives': data['relatives']})
+        else:
+            response_content.update({'relatives': CitizensList.get_all_relatives(import_id, citizen.id)})
 
-        return EncodedJsonResponse({'data': {'import_id': import_inst.id}}, status=201)
+        with phase(request, 'encode'):
+            return EncodedJsonResponse({'data': response_content}, status=200)
 
-    def is_valid(self, data):
+    @staticmethod
+    def is_valid_citizen(citizen):
         """
-        Check if passed data corresponds requested rules.
+        Check if passed data of citizen is valid.
         """
-        if not isinstance(data, dict):
-            return False
+        allowed_fields = ('town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender', 'relatives')
 
-        if 'citizens' not in data:
+        if not isinstance(citizen, dict):
             return False
 
-        citizens = data['citizens']
-
-        if not isinstance(citizens, list):
-            return False
+        for field_name, value in citizen.items():
+            if field_name not in allowed_fields:
+                return False
 
-        relatives_dict = {}
-        citizens_list = []
+            is_valid_field = getattr(CitizenFields, 'check_%s' % field_name)
 
-        for citizen in citizens:
-            if not self.citizen_is_valid(citizen):
+            if not is_valid_field(value):
                 return False
 
-            current_citizen_id = citizen['citizen_id']
-            relatives = citizen['relatives']
+        return True
 
-            if not isinstance(relatives, (list, tuple)):
-                return False
 
-            checked_relatives = []
-            for citizen_id in citizens_list:
-                if current_citizen_id in relatives_dict[citizen_id]:
-                    checked_relatives.append(citizen_id)
+class CitizensList(CachedResponseMixin, View):
+    citizen_fields = ('citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender')
 
-            for relative in relatives:
-                if relative in citizens_list and relative not in checked_relatives:
-                    return False
+    def get(self, request, *args, **kwargs):
+        import_id = kwargs['import_id']
 
-            relatives_dict.update({current_citizen_id: relatives})
-            citizens_list.append(current_citizen_id)
+        try:
+            fields, with_relatives = self.get_fields(request.GET)
+            after, limit = self.get_page(request.GET)
+        except ValueError:
+            return EncodedJsonResponse({}, status=400)
 
-        for index, count in Counter(citizens_list).items():
-            if count > 1:
-                return False
+        # citizen_id is needed to attach relatives and id to fetch relatives of the page, they are not returned
+        query_fields = fields
+        if with_relatives:
+            query_fields += tuple(field for field in ('citizen_id', 'id') if field not in fields)
 
-        return True
+        citizens = Citizens.objects.filter(import_id=import_id)
 
-    @staticmethod
-    def citizen_is_valid(citizen):
-        """
-        Check if citizen dict is valid.
-        """
-        required_fields = (
-            'citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender', 'relatives'
-        )
+        if limit is not None:
+            return self.get_page_response(request, import_id, citizens, query_fields, fields, with_relatives, after,
+                                          limit)
 
-        if not isinstance(citizen, dict):
-            return False
+        citizens = citizens.values_list(*query_fields).iterator()
+        chunk_size = settings.CITIZENS_LIST_STREAMING_THRESHOLD
+        key_index = query_fields.index('citizen_id') if with_relatives else 0
 
-        for field in required_fields:
-            if field not in citizen:
-                return False
+        # big imports are streamed from the server-side cursor instead of being loaded at once
+        with phase(request, 'load'):
+            data = list(islice(citizens, chunk_size))
 
-            check_function = getattr(CitizenFields, 'check_%s' % field)
+            if not data:
+                return EncodedJsonResponse({}, status=404)
 
-            if not check_function(citizen[field]):
-                return False
+        if len(data) < chunk_size:
+            with phase(request, 'load'):
+                relatives_map = self.get_relatives_map(import_id) if with_relatives else None
 
-        if len(citizen) != 9:
-            return False
+            with phase(request, 'encode'):
+                rows = list(citizen_rows(data, fields, relatives_map, key_index))
 
-        return True
+                return EncodedJsonResponse({'data': rows}, status=200)
 
-    @staticmethod
-    def get_relative_pairs(citizens, citizens_list):
-        """
-        Get list of relative pairs.
-        """
-        relative_pairs = []
+        chunks = chain((data,), iter(lambda: list(islice(citizens, chunk_size)), []))
 
-        for citizen in citizens:
-            relatives = citizen['relatives']
-            citizen_id = citizen['citizen_id']
+        return EncodedJsonStreamingResponse(self.iter_chunks_rows(import_id, chunks, query_fields, fields,
+                                                                  with_relatives), status=200)
 
-            for relative in relatives:
-                if relative > citizen_id:
-                    relative_pairs.append((citizens_list[citizen_id], citizens_list[relative]))
+    def iter_chunks_rows(self, import_id, chunks, query_fields, fields, with_relatives):
+        """
+        Yield citizen dicts of the streamed list. Relatives are loaded with one query per chunk of citizens, so
+        only the current chunk and its relatives are kept in memory.
+        """
+        key_index = query_fields.index('citizen_id') if with_relatives else 0
 
-        return relative_pairs
+        for chunk in chunks:
+            relatives_map = None
+            if with_relatives:
+                id_index = query_fields.index('id')
+                relatives_map = self.get_relatives_map(import_id, [row[id_index] for row in chunk])
 
+            yield from citizen_rows(chunk, fields, relatives_map, key_index)
 
-class ChangeImports(View):
     def patch(self, request, *args, **kwargs):
         try:
-            data = json.loads(request.body.decode('utf-8').replace('\'', '\"'))
+            with phase(request, 'parse'):
+                data = read_json(request)
         except JSONDecodeError:
             return EncodedJsonResponse({}, status=400)
 
-        if not self.is_valid_citizen(data):
-            return EncodedJsonResponse({}, status=400)
+        with phase(request, 'validate'):
+            if not self.is_valid_changes(data):
+                return EncodedJsonResponse({}, status=400)
 
         import_id = kwargs['import_id']
-        citizen_id = kwargs['citizen_id']
+        changes = {change['citizen_id']: {field: value for field, value in change.items() if field != 'citizen_id'}
+                   for change in data['citizens']}
 
         try:
-            citizen = Citizens.objects.get(import_id=import_id, citizen_id=citizen_id)
-        except Citizens.DoesNotExist or Citizens.MultipleObjectsReturned:
+            with phase(request, 'update'), transaction.atomic():
+                updater = CitizensUpdater(import_id)
+                updater.update(changes)
+        except (InvalidImportError, DataError):
             return EncodedJsonResponse({}, status=400)
 
-        for field_name, value in data.items():
-            if field_name != 'relatives':
-                setattr(citizen, field_name, value)
+        unchanged_relatives = [updater.citizens[citizen_id].id for citizen_id, change in changes.items()
+                               if 'relatives' not in change]
+        relatives_map = self.get_relatives_map(import_id, unchanged_relatives) if unchanged_relatives else {}
 
-        if 'relatives' in data:
-            self.delete_old_relatives(import_id, citizen.id)
-            relatives = self.add_new_relatives(import_id, citizen.id, data['relatives'])
-            if relatives is None:
-                return EncodedJsonResponse({}, status=400)
+        response_content = []
+        for citizen_id, change in changes.items():
+            citizen = updater.citizens[citizen_id]
+
+            citizen_content = {field: getattr(citizen, field) for field in self.citizen_fields}
+            citizen_content['birth_date'] = format_birth_date(citizen.birth_date)
+            if 'relatives' in change:
+                citizen_content['relatives'] = change['relatives']
             else:
-                try:
-                    citizen.save()
-                except DataError:
-                    return EncodedJsonResponse({}, status=400)
+                citizen_content['relatives'] = relatives_map.get(citizen_id, [])
 
-            Relatives.objects.bulk_create(relatives)
-        else:
-            try:
-                citizen.save()
-            except DataError:
-                return EncodedJsonResponse({}, status=400)
+            response_content.append(citizen_content)
 
-        response_content = model_to_dict(citizen, exclude=('id', 'import_id'))
-        if 'relatives' in data:
-            response_content.update({'relatives': data['relatives']})
-        else:
-            response_content.update({'relatives': CitizensList.get_all_relatives(import_id, citizen.id)})
-
-        return EncodedJsonResponse({'data': response_content}, status=200)
+        with phase(request, 'encode'):
+            return EncodedJsonResponse({'data': response_content}, status=200)
 
     @staticmethod
-    def is_valid_citizen(citizen):
+    def is_valid_changes(data):
         """
-        Check if passed data of citizen is valid.
+        Check if passed {"citizens": [...]} changes of citizens are valid, every change has citizen_id and citizens
+        are not repeated.
         """
-        allowed_fields = ('town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender', 'relatives')
+        if not isinstance(data, dict) or list(data) != ['citizens']:
+            return False
 
-        if not isinstance(citizen, dict):
+        changes = data['citizens']
+
+        if not isinstance(changes, list) or not changes:
             return False
 
-        for field_name, value in citizen.items():
-            if field_name not in allowed_fields:
+        citizen_ids = set()
+
+        for change in changes:
+            if not isinstance(change, dict) or not CitizenFields.check_citizen_id(change.get('citizen_id')):
                 return False
 
-            is_valid_field = getattr(CitizenFields, 'check_%s' % field_name)
+            if change['citizen_id'] in citizen_ids:
+                return False
 
-            if not is_valid_field(value):
+            citizen_ids.add(change['citizen_id'])
+
+            if not ChangeImports.is_valid_citizen({field: value for field, value in change.items()
+                                                   if field != 'citizen_id'}):
                 return False
 
         return True
 
-    @staticmethod
-    def delete_old_relatives(import_id, citizen_id):
+    def get_page_response(self, request, import_id, citizens, query_fields, fields, with_relatives, after, limit):
         """
-        Delete from database old relatives of current citizen.
+        Get response with the page of citizens ordered by citizen_id, the page is found by the unique index of
+        (import_id, citizen_id), so its time does not depend on the import size.
         """
-        relatives = Relatives.objects.filter(import_id=import_id, citizen_1_id=citizen_id)
-        relatives |= Relatives.objects.filter(import_id=import_id, citizen_2_id=citizen_id)
-        relatives.delete()
+        if after is not None:
+            citizens = citizens.filter(citizen_id__gt=after)
 
-    @staticmethod
-    def add_new_relatives(import_id, citizen_id, relatives_list):
+        # citizen_id of the last citizen is the cursor of the next page
+        if 'citizen_id' not in query_fields:
+            query_fields += ('citizen_id',)
+
+        with phase(request, 'load'):
+            data = list(citizens.order_by('citizen_id').values_list(*query_fields)[:limit])
+
+            if not data and not Citizens.objects.filter(import_id=import_id).exists():
+                return EncodedJsonResponse({}, status=404)
+
+            relatives_map = None
+            if with_relatives and data:
+                id_index = query_fields.index('id')
+                relatives_map = self.get_relatives_map(import_id, [row[id_index] for row in data])
+
+        key_index = query_fields.index('citizen_id')
+        next_after = data[-1][key_index] if len(data) == limit else None
+
+        with phase(request, 'encode'):
+            rows = list(citizen_rows(data, fields, relatives_map, key_index))
+
+            return EncodedJsonResponse({'data': rows, 'next_after': next_after}, status=200)
+
+    def get_fields(self, query):
         """
-        Add to database new relatives from relatives list.
+        Get tuple of requested citizen fields and if relatives are requested from the fields query parameter.
+        Raise ValueError if fields are unknown.
         """
-        relative_instances = []
+        if 'fields' not in query:
+            return self.citizen_fields, True
 
-        import_inst = Imports(pk=import_id)
-        citizen_1 = Citizens(pk=citizen_id)
+        requested_fields = query['fields'].split(',')
 
-        citizens = list(Citizens.objects.filter(import_id=import_id).values('id', 'citizen_id'))
-        for relative in relatives_list:
-            citizen_2_id_found = False
-            for citizen in citizens:
-                if citizen['citizen_id'] == relative:
-                    citizen_2_id = citizen['id']
-                    citizen_2_id_found = True
-                    break
+        if not requested_fields or not set(requested_fields) <= set(self.citizen_fields + ('relatives',)):
+            raise ValueError
 
-            if not citizen_2_id_found:
-                return None
+        fields = tuple(field for field in self.citizen_fields if field in requested_fields)
 
-            citizen_2 = Citizens(pk=citizen_2_id)
+        return fields, 'relatives' in requested_fields
 
-            relative_instances.append(
-                Relatives(import_id=import_inst, citizen_1_id=citizen_1, citizen_2_id=citizen_2)
-            )
+    @staticmethod
+    def get_page(query):
+        """
+        Get after citizen_id and limit of the page from the query parameters, limit is None if the list is not paged.
+        Raise ValueError if parameters are not valid.
+        """
+        if 'after' not in query and 'limit' not in query:
+            return None, None
 
-        return relative_instances
+        after = int(query['after']) if 'after' in query else None
+        limit = int(query.get('limit', settings.CITIZENS_LIST_MAX_LIMIT))
 
+        if not 0 < limit <= settings.CITIZENS_LIST_MAX_LIMIT:
+            raise ValueError
 
-class CitizensList(View):
-    def get(self, request, *args, **kwargs):
-        import_id = kwargs['import_id']
-        citizens = Citizens.objects.filter(import_id=import_id)
+        return after, limit
 
-        if citizens.count() == 0:
-            return EncodedJsonResponse({}, status=404)
+    @staticmethod
+    def get_relatives_map(import_id, citizen_pks=None):
+        """
+        Get dict of relatives lists of all citizens of the import or only of the citizens with citizen_pks with
+        one query. Keys and relatives are citizen_id values.
+        """
+        # conditions on the joined citizens let PostgreSQL scan only the partition of the import
+        relative_pairs = Relatives.objects.filter(import_id=import_id, citizen_1_id__import_id=import_id,
+                                                  citizen_2_id__import_id=import_id)
 
-        data = []
-        for citizen in citizens:
-            model_dict = model_to_dict(citizen, exclude=('id', 'import_id'))
-            model_dict.update({'relatives': self.get_all_relatives(import_id, citizen.id)})
-            data.append(model_dict)
+        if citizen_pks is not None:
+            relative_pairs = relative_pairs.filter(Q(citizen_1_id__in=citizen_pks) | Q(citizen_2_id__in=citizen_pks))
 
-        return EncodedJsonResponse({'data': data}, status=200)
+        relative_pairs = relative_pairs.values_list('citizen_1_id__citizen_id', 'citizen_2_id__citizen_id')
+
+        relatives_map = defaultdict(list)
+        for citizen_1, citizen_2 in relative_pairs:
+            relatives_map[citizen_1].append(citizen_2)
+            relatives_map[citizen_2].append(citizen_1)
+
+        return relatives_map
 
     @staticmethod
     def get_all_relatives(import_id, citizen_id):
         """
         Get list of all relatives of citizen.
         """
-        relatives = Relatives.objects.filter(import_id=import_id, citizen_1_id=citizen_id)
-        relatives |= Relatives.objects.filter(import_id=import_id, citizen_2_id=citizen_id)
+        relatives = Relatives.objects.filter(
+            Q(citizen_1_id=citizen_id) | Q(citizen_2_id=citizen_id), import_id=import_id,
+            citizen_1_id__import_id=import_id, citizen_2_id__import_id=import_id
+        ).values_list('citizen_1_id', 'citizen_1_id__citizen_id', 'citizen_2_id__citizen_id')
 
         relatives_list = []
-        for relative in relatives:
-            citizen = relative.citizen_2_id if relative.citizen_1_id_id == citizen_id else relative.citizen_1_id
-            relatives_list.append(citizen.citizen_id)
+        for citizen_1_pk, citizen_1, citizen_2 in relatives:
+            relatives_list.append(citizen_2 if citizen_1_pk == citizen_id else citizen_1)
 
         return relatives_list
 
 
-class CitizenBirthdaysStat(View):
+class CitizenBirthdaysStat(CachedResponseMixin, View):
     def get(self, request, *args, **kwargs):
         import_id = kwargs['import_id']
-        citizens = Citizens.objects.filter(import_id=import_id).values('id', 'birth_date')
 
-        if citizens.count() == 0:
+        if not Citizens.objects.filter(import_id=import_id).exists():
             return EncodedJsonResponse({}, status=404)
 
-        data = {
-            '1': [], '2': [], '3': [], '4': [], '5': [], '6': [], '7': [], '8': [], '9': [], '10': [], '11': [],
-            '12': []
-        }
-
-        for citizen in citizens:
-            birth_date_str = citizen['birth_date']
-            birth_date = datetime.strptime(birth_date_str, '%d.%m.%Y')
-            month = str(birth_date.month)
-
-            relatives = CitizensList.get_all_relatives(import_id, citizen['id'])
+        data = {str(month): [] for month in range(1, 13)}
 
-            presents = data[month]
+        with phase(request, 'load'):
+            presents = BirthdayPresents.objects.filter(import_id=import_id).order_by(
+                'month', 'citizen_id'
+            ).values_list('month', 'citizen_id', 'presents')
 
-            for relative in relatives:
-                present_found = False
-                for present in presents:
-                    if present['citizen_id'] == relative:
-                        presents_count = present['presents']
-                        present['presents'] = presents_count + 1
-                        present_found = True
-                        break
+            for month, citizen_id, presents_count in presents:
+                data[str(month)].append({'citizen_id': citizen_id, 'presents': presents_count})
 
-                if not present_found:
-                    presents.append({'citizen_id': relative, 'presents': 1})
+        with phase(request, 'encode'):
+            return EncodedJsonResponse({'data': data}, status=200)
 
-        return EncodedJsonResponse({'data': data}, status=200)
 
+class CitizensTownsStatPercentileAge(CachedResponseMixin, View):
+    expires_at_midnight = True
 
-class CitizensTownsStatPercentileAge(View):
     def get(self, request, *args, **kwargs):
-        import_id = kwargs['import_id']
-        data = []
-
-        citizens = Citizens.objects.filter(import_id=import_id).order_by('town').values('birth_date', 'town')
-
-        current_town = ''
-        years_list = []
-        for citizen in citizens:
-            town = citizen['town']
-
-            if current_town == town:
-                years_list.append(self.count_year(citizen['birth_date']))
-            else:
-                if current_town != '':
-                    data.append(self.count_percentiles(years_list, current_town))
-                years_list = [self.count_year(citizen['birth_date'])]
-                current_town = town
+        with phase(request, 'compute'):
+            data = get_age_percentiles(kwargs['import_id'], self.import_version)
 
-        data.append(self.count_percentiles(years_list, current_town))
-
-        return EncodedJsonResponse({'data': data}, status=200)
+        if not data:
+            return EncodedJsonResponse({}, status=404)
 
-    @staticmethod
-    def count_year(date):
-        """
-        Count the years between today and the given str date.
-        """
-        date_obj = datetime.strptime(date, '%d.%m.%Y')
-        difference = datetime.utcnow() - date_obj
-        total_seconds = difference.total_seconds()
+        with phase(request, 'encode'):
+            return EncodedJsonResponse({'data': data}, status=200)
 
-        return total_seconds / 60 / 60 / 24 / 365.25
 
-    @staticmethod
-    def count_percentiles(years_list, town):
-        """
-        Return dict of percentiles p50, p75, p99 in the below format:
-        {'town': town, 'p50': p50, 'p75': p75, 'p99': p99}
-        """
-        p50 = percentile(years_list, 50, interpolation='linear')
-        p75 = percentile(years_list, 75, interpolation='linear')
-        p99 = percentile(years_list, 99, interpolation='linear')
+class MetricsView(View):
+    def get(self, request, *args, **kwargs):
+        if request.META.get('REMOTE_ADDR') not in settings.CITIZENS_METRICS_ALLOWED_ADDRESSES:
+            return EncodedJsonResponse({}, status=404)
 
-        return {'town': town, 'p50': float('%.2f' % p50), 'p75': float('%.2f' % p75), 'p99': float('%.2f' % p99)}
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')